@@ -1,5 +1,8 @@
 import mysql.connector as mysql
+from mysql.connector import pooling
+from contextlib import contextmanager
 import os
+import time
 
 class DbConnector:
     """
@@ -7,38 +10,91 @@ class DbConnector:
     Connector needs HOST, DATABASE, USER and PASSWORD to connect,
     while PORT is optional and should be 3306.
 
+    Connections come from a pool of POOL_SIZE connections (MYSQL_POOL_SIZE, default 5),
+    so parallel loaders and query runners can share them. db_connection and cursor
+    are one connection checked out for the lifetime of the connector; other
+    connections are borrowed with checkout().
+
     Example:
     HOST = "tdt4225-00.idi.ntnu.no" // Your server IP address/domain name
     DATABASE = "testdb" // Database name, if you just want to connect to MySQL server, leave it empty
     USER = "testuser" // This is the user you created and added privileges for
     PASSWORD = "test123" // The password you set for said user
+
+    with connector.checkout() as (connection, cursor):
+        cursor.execute("SELECT COUNT(*) FROM User")
     """
+    dialect = 'mysql'
 
-    def __init__(self):
+    def __init__(self, pool_size=None, retries=5, backoff=0.5):
         # Get database connection details from environment variables
         HOST = os.environ.get('MYSQL_HOST', 'mysql')
         DATABASE = os.environ.get('MYSQL_DATABASE', 'geolife')
         USER = os.environ.get('MYSQL_USER', 'root')
         PASSWORD = os.environ.get('MYSQL_PASSWORD', 'group20')
-        try:
-            self.db_connection = mysql.connect(host=HOST, database=DATABASE, user=USER, password=PASSWORD, port=3306)
-        except Exception as e:
-            print("ERROR: Failed to connect to db:", e)
+        POOL_SIZE = pool_size or int(os.environ.get('MYSQL_POOL_SIZE', 5))
+        if not 1 <= POOL_SIZE <= pooling.CNX_POOL_MAXSIZE:
+            raise ValueError(f"Pool size must be between 1 and {pooling.CNX_POOL_MAXSIZE}, got {POOL_SIZE}")
+
+        self.database = DATABASE
+        self.retries = retries
+        self.backoff = backoff
+        # allow_local_infile is needed by the LOAD DATA LOCAL INFILE loader in loaders.py
+        self.pool = self._retry(lambda: pooling.MySQLConnectionPool(
+            pool_name="geolife", pool_size=POOL_SIZE, pool_reset_session=True,
+            host=HOST, database=DATABASE, user=USER, password=PASSWORD, port=3306,
+            allow_local_infile=True))
 
         # Get the db cursor
+        self.db_connection = self.get_connection()
         self.cursor = self.db_connection.cursor()
 
         print("Connected to:", self.db_connection.get_server_info())
-        # get database information
-        self.cursor.execute("select database();")
-        database_name = self.cursor.fetchone()
-        print("You are connected to the database:", database_name)
+        print("You are connected to the database:", DATABASE)
         print("-----------------------------------------------\n")
 
+    def _retry(self, action):
+        # Runs action, retrying with exponential backoff on connection errors. Errors
+        # such as a wrong password or an unknown database fail right away.
+        for attempt in range(self.retries + 1):
+            try:
+                return action()
+            except (mysql.errors.InterfaceError, mysql.errors.OperationalError, mysql.errors.PoolError) as e:
+                if attempt == self.retries:
+                    print("ERROR: Failed to connect to db:", e)
+                    raise
+                delay = self.backoff * 2 ** attempt
+                print(f"Connecting to db failed ({e}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def get_connection(self):
+        # Borrows a connection from the pool; close() on it hands it back.
+        # Pooled connections can have been dropped by the server while idle, so
+        # they are pinged (and reconnected if needed) before use.
+        connection = self._retry(self.pool.get_connection)
+        connection.ping(reconnect=True, attempts=self.retries + 1, delay=self.backoff)
+        return connection
+
+    @contextmanager
+    def checkout(self, **cursor_kwargs):
+        # Yields (connection, cursor) from the pool and returns both afterwards.
+        # An exception rolls back the open transaction.
+        connection = self.get_connection()
+        cursor = connection.cursor(**cursor_kwargs)
+        try:
+            yield connection, cursor
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
     def close_connection(self):
+        server_info = self.db_connection.get_server_info()
         # close the cursor
         self.cursor.close()
-        # close the DB connection
+        # close the DB connection, which returns it to the pool
         self.db_connection.close()
         print("\n-----------------------------------------------")
-        print("Connection to %s is closed" % self.db_connection.get_server_info())
+        print("Connection to %s is closed" % server_info)
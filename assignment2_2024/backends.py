@@ -0,0 +1,23 @@
+from DbConnector import DbConnector
+from sqlite_backend import SqliteConnector
+
+# Storage backends for main.py and part2.py. Both connectors have the same
+# interface (db_connection, cursor, get_connection, checkout, close_connection)
+# and a dialect name that code with backend-specific SQL can branch on.
+
+
+BACKENDS = {
+    'mysql': DbConnector,
+    'sqlite': SqliteConnector,
+}
+
+
+def get_connector(name='mysql', **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def dialect_of(cursor):
+    # For functions that are only handed a cursor; mysql.connector cursors have no dialect
+    return getattr(cursor, 'dialect', 'mysql')
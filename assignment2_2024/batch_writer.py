@@ -0,0 +1,70 @@
+class BatchWriter:
+    """
+    Buffers rows for one INSERT statement and writes them as a single multi-row
+    statement once max_rows rows or roughly max_bytes bytes of values have been
+    collected. Each flush is committed as one transaction, and rolled back if it fails.
+    With commit_on_flush=False the flushes triggered by add() leave the rows in the
+    caller's open transaction instead, for callers that commit together with other tables.
+
+    Example:
+    writer = BatchWriter(db_connection, cursor, "INSERT INTO User (id, has_labels)", 2)
+    with writer:
+        writer.add(('000', False))
+    """
+
+    def __init__(self, db_connection, cursor, insert_query, column_count, suffix='',
+                 max_rows=1000, max_bytes=1024 * 1024, commit_on_flush=True):
+        self.db_connection = db_connection
+        self.cursor = cursor
+        self.insert_query = insert_query
+        self.suffix = suffix
+        self.row_template = '(' + ', '.join(['%s'] * column_count) + ')'
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.commit_on_flush = commit_on_flush
+        self.rows = []
+        self.pending_bytes = 0
+        self.rows_written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        # A rough estimate of the statement size is enough to stay below max_allowed_packet
+        self.pending_bytes += sum(len(str(value)) + 4 for value in row)
+        if len(self.rows) >= self.max_rows or self.pending_bytes >= self.max_bytes:
+            self.flush(commit=self.commit_on_flush)
+
+    def flush(self, commit=True):
+        # With commit=False the rows join the caller's open transaction
+        if not self.rows:
+            if commit:
+                self.db_connection.commit()
+            return
+        query = f"{self.insert_query} VALUES {', '.join([self.row_template] * len(self.rows))} {self.suffix}".rstrip()
+        params = [value for row in self.rows for value in row]
+        row_count = len(self.rows)
+        self.rows = []
+        self.pending_bytes = 0
+        try:
+            self.cursor.execute(query, params)
+            if commit:
+                self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+        self.rows_written += row_count
+
+    def discard(self):
+        self.rows = []
+        self.pending_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            # Drop what was buffered and undo the open transaction
+            self.discard()
+            self.db_connection.rollback()
+        return False
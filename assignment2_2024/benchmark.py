@@ -0,0 +1,167 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import main as loader_main
+import part2
+from backends import BACKENDS
+from indexes import create_indexes
+from loaders import LOADERS
+from synthetic_dataset import generate
+from tabulate import tabulate
+
+# Generates synthetic datasets at several scales (synthetic_dataset.py), loads each one
+# into an empty database the way main.py does, and runs the part2 report on it.
+# Every main.py stage and part2 query is timed; the results are written as JSON so
+# runs can be compared across commits. Uses the database of the chosen backend
+# and replaces whatever is in it.
+
+DEFAULT_SCALES = ['5x10x200', '20x20x500', '50x40x1000']
+
+
+def parse_scale(text):
+    # "USERSxACTIVITIESxPOINTS", e.g. 20x20x500
+    try:
+        users, activities, points = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected USERSxACTIVITIESxPOINTS, got {text!r}")
+    return users, activities, points
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(timings, name, function, *args, **kwargs):
+    # The stages print progress and tables, which are not of interest here
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[name] = round(time.perf_counter() - start, 4)
+    print(f"  {name}: {timings[name]:.3f}s")
+    return result
+
+
+def run_ingest(dataset_path, loader, workers, backend='mysql'):
+    stages = {}
+    program = loader_main.ActivityTrackerProgram(loader=loader, backend=backend)
+    try:
+        timed(stages, 'recreate_tables', program.recreate_tables)
+        timed(stages, 'populate_users', program.populate_user_table, dataset_path)
+        timed(stages, 'populate_activities_and_trackpoints',
+              program.populate_activity_and_trackpoint_tables, dataset_path, workers=workers)
+        timed(stages, 'create_indexes', create_indexes, program.db_connection, program.cursor)
+        timed(stages, 'refresh_summaries', program.summaries.refresh)
+        timed(stages, 'update_transportation_modes', program.update_transportation_modes, dataset_path)
+        timed(stages, 'verify_transportation_modes', program.verify_transportation_modes, dataset_path)
+
+        counts = {}
+        for table in ('User', 'Activity', 'TrackPoint'):
+            program.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = program.cursor.fetchone()[0]
+    finally:
+        program.connection.close_connection()
+    return stages, counts
+
+
+def run_queries(use_summaries, backend='mysql'):
+    queries = {}
+    # No cache, so every query does its full work
+    program = part2.ActivityTrackerProgram(use_summaries=use_summaries, cache=None, backend=backend)
+    try:
+        for number, method_name in part2.REPORT_QUERIES:
+            timed(queries, number, getattr(program, method_name))
+    finally:
+        program.connection.close_connection()
+    return queries
+
+
+def run_scale(scale, args, work_dir):
+    users, activities, points = scale
+    dataset_path = tempfile.mkdtemp(prefix=f"geolife_{users}x{activities}x{points}_", dir=work_dir)
+    try:
+        start = time.perf_counter()
+        written = generate(dataset_path, users, activities, points,
+                           args.labeled_fraction, args.label_density, args.seed)
+        generate_seconds = round(time.perf_counter() - start, 4)
+
+        print(f"Scale {users}x{activities}x{points}: loading...")
+        stages, counts = run_ingest(dataset_path, args.loader, args.workers, args.backend)
+        print(f"Scale {users}x{activities}x{points}: querying...")
+        queries = run_queries(not args.no_summaries, args.backend)
+    finally:
+        if not args.keep_datasets:
+            shutil.rmtree(dataset_path, ignore_errors=True)
+
+    return {
+        'users': users,
+        'activities_per_user': activities,
+        'points_per_activity': points,
+        'generated': dict(zip(['users', 'activities', 'trackpoints', 'labels'], written)),
+        'generate_seconds': generate_seconds,
+        'loaded': counts,
+        'stages': stages,
+        'queries': queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time main.py and part2.py on synthetic datasets of several sizes.")
+    parser.add_argument('--scales', nargs='+', type=parse_scale, default=[parse_scale(s) for s in DEFAULT_SCALES],
+                        help=f"USERSxACTIVITIESxPOINTS per scale (default: {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument('--labeled-fraction', type=float, default=0.3)
+    parser.add_argument('--label-density', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql')
+    parser.add_argument('--loader', choices=sorted(LOADERS), default='executemany')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-summaries', action='store_true', help="Run the queries against the raw tables")
+    parser.add_argument('--work-dir', default=None, help="Where to write the datasets (default: system temp dir)")
+    parser.add_argument('--keep-datasets', action='store_true')
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    results = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {
+            'backend': args.backend,
+            'loader': args.loader,
+            'workers': args.workers,
+            'use_summaries': not args.no_summaries,
+            'labeled_fraction': args.labeled_fraction,
+            'label_density': args.label_density,
+            'seed': args.seed,
+        },
+        'scales': [],
+    }
+    try:
+        for scale in args.scales:
+            results['scales'].append(run_scale(scale, args, args.work_dir))
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    rows = []
+    for result in results['scales']:
+        rows.append((f"{result['users']}x{result['activities_per_user']}x{result['points_per_activity']}",
+                     result['loaded']['TrackPoint'], round(sum(result['stages'].values()), 3),
+                     round(sum(result['queries'].values()), 3)))
+    print(tabulate(rows, headers=['Scale', 'Trackpoints', 'Load (s)', 'Queries (s)'], tablefmt='psql'))
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
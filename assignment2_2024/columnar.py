@@ -0,0 +1,319 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import time
+import numpy as np
+from distance_engine import haversine_km
+from query_cache import get_dataset_version
+from segments import INVALID_ALTITUDE
+from tabulate import tabulate
+from trackpoint_schema import order_column
+
+# Columnar copy of TrackPoint and Activity for offline analytics. Each column is a
+# .npy file that ColumnarEngine memory-maps, so scans run over contiguous arrays
+# without going through the MySQL row protocol. Trackpoints are stored ordered by
+# (activity_id, id), and activity_offsets.npy gives the slice of each activity:
+# the trackpoints of activity i are offsets[i]:offsets[i + 1].
+#
+#   activity_id.npy, activity_user.npy, activity_mode.npy, activity_start.npy,
+#   activity_end.npy, activity_offsets.npy
+#   trackpoint_activity_id.npy, trackpoint_lat.npy, trackpoint_lon.npy,
+#   trackpoint_altitude.npy, trackpoint_time.npy
+#   meta.json: row counts, user and mode names, dataset version
+#
+# Users and modes are stored as indexes into the names in meta.json (-1 for no
+# mode). Times are epoch seconds of the naive DATETIME values.
+
+TRACKPOINT_DTYPES = {
+    'activity_id': np.int64,
+    'lat': np.float64,
+    'lon': np.float64,
+    'altitude': np.int32,
+    'time': np.int64,
+}
+
+
+def to_epoch_seconds(datetimes):
+    return np.array(datetimes, dtype='datetime64[s]').astype(np.int64)
+
+
+def export(program, directory='columnar', chunk_size=100000):
+    # program is a part2.ActivityTrackerProgram. Returns the number of trackpoints written.
+    os.makedirs(directory, exist_ok=True)
+    # Read from the database, not program.dataset_version, which is only set with a cache
+    dataset_version = get_dataset_version(program.cursor)
+
+    activities = program.execute_query("""SELECT id, user_id, transportation_mode, start_date_time, end_date_time
+                                          FROM Activity ORDER BY id""")
+    users = sorted({row[1] for row in activities if row[1] is not None})
+    modes = sorted({row[2] for row in activities if row[2] is not None})
+    user_index = {user_id: i for i, user_id in enumerate(users)}
+    mode_index = {mode: i for i, mode in enumerate(modes)}
+    activity_ids = np.array([row[0] for row in activities], dtype=np.int64)
+    np.save(os.path.join(directory, 'activity_id.npy'), activity_ids)
+    np.save(os.path.join(directory, 'activity_user.npy'),
+            np.array([user_index.get(row[1], -1) for row in activities], dtype=np.int32))
+    np.save(os.path.join(directory, 'activity_mode.npy'),
+            np.array([mode_index.get(row[2], -1) for row in activities], dtype=np.int16))
+    np.save(os.path.join(directory, 'activity_start.npy'), to_epoch_seconds([row[3] for row in activities]))
+    np.save(os.path.join(directory, 'activity_end.npy'), to_epoch_seconds([row[4] for row in activities]))
+
+    # Output files are sized up front and filled while the rows are streamed
+    program.cursor.execute("SELECT COUNT(*) FROM TrackPoint")
+    count = program.cursor.fetchone()[0]
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(directory, f"trackpoint_{name}.npy"),
+                                        mode='w+', dtype=dtype, shape=(count,))
+        for name, dtype in TRACKPOINT_DTYPES.items()
+    }
+    position = 0
+    query = f"""SELECT activity_id, lat, lon, altitude, date_time
+                FROM TrackPoint
+                ORDER BY activity_id, {order_column(program.cursor)}"""
+    for rows in program.iter_query_chunks(query, chunk_size=chunk_size):
+        if position + len(rows) > count:
+            raise RuntimeError("TrackPoint changed during the export")
+        end = position + len(rows)
+        activity_id, lat, lon, altitude, date_time = zip(*rows)
+        columns['activity_id'][position:end] = activity_id
+        columns['lat'][position:end] = lat
+        columns['lon'][position:end] = lon
+        columns['altitude'][position:end] = altitude
+        columns['time'][position:end] = to_epoch_seconds(date_time)
+        position = end
+    if position != count:
+        raise RuntimeError("TrackPoint changed during the export")
+    for column in columns.values():
+        column.flush()
+
+    offsets = np.searchsorted(columns['activity_id'], activity_ids, side='left')
+    np.save(os.path.join(directory, 'activity_offsets.npy'),
+            np.append(offsets, count).astype(np.int64))
+    # Activities are sorted by id, so a trackpoint whose activity is missing would
+    # leave a gap between the end of one activity and the start of the next
+    ends = np.searchsorted(columns['activity_id'], activity_ids, side='right')
+    if not np.array_equal(ends[:-1], offsets[1:]) or (len(ends) and ends[-1] != count):
+        raise RuntimeError("TrackPoint has rows without a matching Activity")
+
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({
+            'dataset_version': dataset_version,
+            'activities': len(activities),
+            'trackpoints': count,
+            'users': users,
+            'modes': modes,
+        }, f, indent=2)
+    return count
+
+
+class ColumnarEngine:
+    """
+    Memory-maps an export and answers part2 queries 7-10 with vectorized scans.
+    Pair-wise measures (distance, altitude gain, time gaps) are computed over pairs of
+    consecutive trackpoints in the same activity, in chunks of chunk_size points.
+    """
+
+    def __init__(self, directory='columnar', chunk_size=1000000):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.users = self.meta['users']
+        self.modes = self.meta['modes']
+        self.activity_id = self._load('activity_id')
+        self.activity_user = self._load('activity_user')
+        self.activity_mode = self._load('activity_mode')
+        self.activity_start = self._load('activity_start')
+        self.activity_offsets = self._load('activity_offsets')
+        self.trackpoint = {name: self._load(f"trackpoint_{name}") for name in TRACKPOINT_DTYPES}
+        self._trackpoint_activity = None
+
+    def _load(self, name):
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+
+    def trackpoint_activity(self):
+        # Row of each trackpoint's activity in the activity arrays
+        if self._trackpoint_activity is None:
+            self._trackpoint_activity = np.repeat(np.arange(len(self.activity_id), dtype=np.int32),
+                                                  np.diff(self.activity_offsets))
+        return self._trackpoint_activity
+
+    def activity_mask(self, user_id=None, year=None, mode=None):
+        mask = np.ones(len(self.activity_id), dtype=bool)
+        if user_id is not None:
+            mask &= self.activity_user == (self.users.index(user_id) if user_id in self.users else -2)
+        if year is not None:
+            years = self.activity_start.astype('datetime64[s]').astype('datetime64[Y]').astype(np.int64) + 1970
+            mask &= years == year
+        if mode is not None:
+            mask &= self.activity_mode == (self.modes.index(mode) if mode in self.modes else -2)
+        return mask
+
+    def iter_pairs(self, columns, activity_mask=None):
+        # Yields (activity row, {column: (first, second)}) for every pair of consecutive
+        # trackpoints in the same (selected) activity
+        activity = self.trackpoint_activity()
+        last = len(activity) - 1
+        for start in range(0, max(last, 0), self.chunk_size):
+            stop = min(start + self.chunk_size, last)
+            first_activity = activity[start:stop]
+            keep = first_activity == activity[start + 1:stop + 1]
+            if activity_mask is not None:
+                keep &= activity_mask[first_activity]
+            pairs = {name: (np.asarray(self.trackpoint[name][start:stop])[keep],
+                            np.asarray(self.trackpoint[name][start + 1:stop + 1])[keep])
+                     for name in columns}
+            yield first_activity[keep], pairs
+
+    def per_user(self, activity_rows, values):
+        # Sums values by the user of each activity row; returns an array indexed like self.users
+        users = self.activity_user[activity_rows]
+        known = users >= 0
+        return np.bincount(users[known], weights=values[known], minlength=len(self.users))
+
+    def total_distance_km(self, user_id, year, mode):
+        mask = self.activity_mask(user_id, year, mode)
+        total = 0.0
+        for _, pairs in self.iter_pairs(('lat', 'lon'), mask):
+            (lat1, lat2), (lon1, lon2) = pairs['lat'], pairs['lon']
+            total += float(haversine_km(lat1, lon1, lat2, lon2).sum())
+        return total
+
+    def altitude_gain_feet(self):
+        # {user_id: feet} over pairs where both altitudes are known and the second is higher
+        totals = np.zeros(len(self.users))
+        for rows, pairs in self.iter_pairs(('altitude',)):
+            first, second = pairs['altitude']
+            diff = second.astype(np.int64) - first
+            valid = (first != INVALID_ALTITUDE) & (second != INVALID_ALTITUDE) & (diff > 0)
+            totals += self.per_user(rows[valid], diff[valid])
+        return {self.users[i]: float(total) for i, total in enumerate(totals) if total > 0}
+
+    def invalid_activity_counts(self, max_gap_seconds=300):
+        # {user_id: number of activities with a gap of max_gap_seconds or more}
+        invalid = np.zeros(len(self.activity_id), dtype=bool)
+        for rows, pairs in self.iter_pairs(('time',)):
+            first, second = pairs['time']
+            invalid[rows[second - first >= max_gap_seconds]] = True
+        users = self.activity_user[invalid]
+        counts = np.bincount(users[users >= 0], minlength=len(self.users))
+        return {self.users[i]: int(count) for i, count in enumerate(counts) if count}
+
+    def users_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        # Strictly inside, like MBRContains
+        activity = self.trackpoint_activity()
+        users = set()
+        for start in range(0, len(activity), self.chunk_size):
+            lat = self.trackpoint['lat'][start:start + self.chunk_size]
+            lon = self.trackpoint['lon'][start:start + self.chunk_size]
+            inside = (lat > min_lat) & (lat < max_lat) & (lon > min_lon) & (lon < max_lon)
+            users.update(self.activity_user[np.unique(activity[start:start + self.chunk_size][inside])].tolist())
+        return sorted(self.users[i] for i in users if i >= 0)
+
+    # The part2 queries, returning what the ActivityTrackerProgram methods return
+
+    def query_7(self):
+        return self.total_distance_km('112', 2008, 'walk')
+
+    def query_8(self):
+        ranking = sorted(self.altitude_gain_feet().items(), key=lambda item: item[1], reverse=True)[:20]
+        return [(user_id, round(feet * 0.3048, 2)) for user_id, feet in ranking]
+
+    def query_9(self):
+        return sorted(self.invalid_activity_counts().items(), key=lambda item: item[1], reverse=True)
+
+    def query_10(self):
+        # Same box as part2 query 10, at the corrected latitude 39.916
+        return [(user_id,) for user_id in self.users_in_bbox(39.9155, 116.3965, 39.9165, 116.3975)]
+
+
+# (query number, ActivityTrackerProgram method, ColumnarEngine method)
+COLUMNAR_QUERIES = [
+    ('7', 'calculate_total_walking_distance_2008_user112', 'query_7'),
+    ('8', 'top_20_users_by_altitude_gain', 'query_8'),
+    ('9', 'find_users_with_invalid_activities', 'query_9'),
+    ('10', 'find_users_in_forbidden_city', 'query_10'),
+]
+
+
+def same_result(number, sql_result, columnar_result):
+    if number == '7':
+        return math.isclose(sql_result, columnar_result, rel_tol=1e-9, abs_tol=1e-6)
+    if number == '8':
+        # Users with equal gains may be cut off differently at 20, so compare the gains
+        # and the users above the lowest gain in the list
+        sql_values = [round(float(value), 2) for _, value in sql_result]
+        columnar_values = [value for _, value in columnar_result]
+        if not np.allclose(sql_values, columnar_values, atol=0.011):
+            return False
+        if not sql_values:
+            return True
+        cutoff = min(sql_values) + 0.011
+        return ({user for user, value in sql_result if float(value) > cutoff} ==
+                {user for user, value in columnar_result if value > cutoff})
+    if number == '9':
+        return dict(sql_result) == dict(columnar_result)
+    return list(map(tuple, sql_result)) == list(map(tuple, columnar_result))
+
+
+def verify(program, engine):
+    # Runs queries 7-10 on both MySQL and the export; returns [(number, sql s, columnar s, match), ...]
+    if engine.meta['dataset_version'] != get_dataset_version(program.cursor):
+        print("Warning: the export was made from a different dataset version than the database has now.")
+    rows = []
+    for number, sql_method, columnar_method in COLUMNAR_QUERIES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sql_result = getattr(program, sql_method)()
+            sql_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        columnar_result = getattr(engine, columnar_method)()
+        columnar_seconds = time.perf_counter() - start
+        rows.append((number, round(sql_seconds, 3), round(columnar_seconds, 3),
+                     same_result(number, sql_result, columnar_result)))
+    return rows
+
+
+def main():
+    from part2 import ActivityTrackerProgram
+
+    parser = argparse.ArgumentParser(description="Export TrackPoint/Activity to memory-mapped columns and query them.")
+    parser.add_argument('command', choices=['export', 'report', 'verify'],
+                        help="export: write the columns; report: run queries 7-10 on them; "
+                             "verify: compare the results and timings with the SQL queries")
+    parser.add_argument('--directory', default='columnar', help="Where the columns are kept (default: columnar)")
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        engine = ColumnarEngine(args.directory)
+        print(f"7. Total distance walked in 2008 by user with id=112: {engine.query_7():.2f} km")
+        print("8. Top 20 users who have gained the most altitude meters:")
+        print(tabulate(engine.query_8(), headers=['User ID', 'Total Meters Gained'], tablefmt='psql'))
+        print("9. Users with invalid activities and their count:")
+        print(tabulate(engine.query_9(), headers=['User ID', 'Invalid Activity Count'], tablefmt='psql'))
+        print("10. Users who have tracked an activity in the Forbidden City of Beijing:")
+        print(tabulate(engine.query_10(), headers=['User ID'], tablefmt='psql'))
+        return
+
+    program = None
+    try:
+        # Uncached and on the raw tables, so verify compares against what the database returns now
+        program = ActivityTrackerProgram(use_summaries=False, cache=None)
+        if args.command == 'export':
+            start = time.perf_counter()
+            count = export(program, args.directory)
+            print(f"Exported {count} trackpoints to {args.directory} in {time.perf_counter() - start:.2f}s")
+        else:
+            rows = verify(program, ColumnarEngine(args.directory))
+            print(tabulate(rows, headers=['Query', 'SQL (s)', 'Columnar (s)', 'Same result'], tablefmt='psql'))
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        if program:
+            program.connection.close_connection()
+
+if __name__ == '__main__':
+    main()
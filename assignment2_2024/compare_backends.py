@@ -0,0 +1,97 @@
+import argparse
+import contextlib
+import decimal
+import io
+import math
+import time
+import part2
+from backends import BACKENDS
+from benchmark import run_ingest
+from tabulate import tabulate
+
+# Runs the part2 report on each backend and compares the results and timings.
+# With --dataset-path, each backend is first loaded from scratch with the same
+# dataset, and the load is timed too. Query results are compared after
+# normalizing numbers (MySQL returns DECIMAL where SQLite returns floats).
+
+
+def normalize(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    return value
+
+
+def same(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return (isinstance(a, (int, float)) and isinstance(b, (int, float))
+                and math.isclose(a, b, rel_tol=1e-4, abs_tol=1e-3))
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[key], b[key]) for key in a)
+    return a == b
+
+
+def compare(a, b):
+    a, b = normalize(a), normalize(b)
+    if same(a, b):
+        return 'yes'
+    # Rows with equal sort keys may come back in either order
+    if isinstance(a, list) and isinstance(b, list) and same(sorted(a, key=repr), sorted(b, key=repr)):
+        return 'yes (order of ties differs)'
+    return 'NO'
+
+
+def run_report(backend, use_summaries):
+    results = {}
+    timings = {}
+    program = part2.ActivityTrackerProgram(use_summaries=use_summaries, cache=None, backend=backend)
+    try:
+        for number, method_name in part2.REPORT_QUERIES:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                results[number] = getattr(program, method_name)()
+                timings[number] = time.perf_counter() - start
+    finally:
+        program.connection.close_connection()
+    return results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare part2 results and timings across storage backends.")
+    parser.add_argument('--backends', nargs=2, choices=sorted(BACKENDS), default=['mysql', 'sqlite'])
+    parser.add_argument('--dataset-path', help="Load this dataset into every backend first (replaces their contents)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-summaries', action='store_true', help="Run the queries against the raw tables")
+    args = parser.parse_args()
+
+    first, second = args.backends
+    try:
+        if args.dataset_path:
+            load_rows = []
+            for backend in args.backends:
+                print(f"Loading {backend}...")
+                stages, counts = run_ingest(args.dataset_path, 'executemany', args.workers, backend)
+                load_rows.append((backend, counts['TrackPoint'], round(sum(stages.values()), 3)))
+            print(tabulate(load_rows, headers=['Backend', 'Trackpoints', 'Load (s)'], tablefmt='psql'))
+
+        first_results, first_timings = run_report(first, not args.no_summaries)
+        second_results, second_timings = run_report(second, not args.no_summaries)
+    except Exception as e:
+        print("An error occurred:", e)
+        return
+
+    rows = []
+    for number, method_name in part2.REPORT_QUERIES:
+        rows.append((number, method_name, round(first_timings[number], 3), round(second_timings[number], 3),
+                     compare(first_results[number], second_results[number])))
+    rows.append(('', 'total', round(sum(first_timings.values()), 3), round(sum(second_timings.values()), 3), ''))
+    print(tabulate(rows, headers=['Query', 'Method', f'{first} (s)', f'{second} (s)', 'Same result'],
+                   tablefmt='psql'))
+
+if __name__ == '__main__':
+    main()
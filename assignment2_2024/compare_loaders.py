@@ -0,0 +1,45 @@
+import argparse
+import time
+from main import ActivityTrackerProgram
+from loaders import LOADERS
+from tabulate import tabulate
+
+# Loads the dataset once per TrackPoint loader and compares the wall-clock time
+# of the Activity/TrackPoint phase. Every run starts from empty tables.
+
+
+def run_loader(loader, dataset_path, workers):
+    program = ActivityTrackerProgram(loader=loader)
+    try:
+        program.recreate_tables()
+        program.populate_user_table(dataset_path)
+
+        start = time.perf_counter()
+        program.populate_activity_and_trackpoint_tables(dataset_path, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        program.cursor.execute("SELECT COUNT(*) FROM TrackPoint")
+        trackpoint_count = program.cursor.fetchone()[0]
+    finally:
+        program.connection.close_connection()
+    return elapsed, trackpoint_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the TrackPoint bulk-load backends.")
+    parser.add_argument('--dataset-path', default='dataset')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--loaders', nargs='+', choices=sorted(LOADERS), default=sorted(LOADERS))
+    args = parser.parse_args()
+
+    results = []
+    for loader in args.loaders:
+        elapsed, trackpoint_count = run_loader(loader, args.dataset_path, args.workers)
+        results.append((loader, trackpoint_count, round(elapsed, 2), round(trackpoint_count / elapsed) if elapsed else None))
+
+    print(tabulate(results, headers=['Loader', 'Trackpoints', 'Seconds', 'Rows/s'], tablefmt='psql'))
+    if len({row[1] for row in results}) > 1:
+        print("WARNING: the loaders did not produce the same number of trackpoints.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import threading
+from tabulate import tabulate
+
+# One scan of the dataset tree, shared by the main.py stages instead of an os.walk each:
+#   dataset/Data/<user_id>/labels.txt             (labeled users only)
+#   dataset/Data/<user_id>/Trajectory/<name>.plt
+# User directories are scanned with os.scandir on a thread pool, since the time
+# goes to directory reads and stat calls rather than Python.
+#
+# The result is cached as JSON. A user is only rescanned if the mtime of its
+# directory or of its Trajectory directory changed, which happens whenever a file
+# in them is added, removed or renamed. A file rewritten in place does not change
+# them, so incremental loads, which compare file sizes and mtimes, scan without the cache.
+
+DEFAULT_CACHE_PATH = '.discovery_cache.json'
+
+# path is relative to dataset/Data, as in IngestManifest
+PltFile = collections.namedtuple('PltFile', ['user_id', 'path', 'size', 'mtime'])
+
+
+def scan_user(data_path, user_id):
+    # Cache entry for one user directory
+    user_path = os.path.join(data_path, user_id)
+    trajectory_path = os.path.join(user_path, 'Trajectory')
+    entry = {'user_id': user_id, 'mtime_ns': os.stat(user_path).st_mtime_ns,
+             'trajectory_mtime_ns': None, 'labels': False, 'files': []}
+    with os.scandir(user_path) as entries:
+        for item in entries:
+            if item.name == 'labels.txt' and item.is_file():
+                entry['labels'] = True
+    if os.path.isdir(trajectory_path):
+        entry['trajectory_mtime_ns'] = os.stat(trajectory_path).st_mtime_ns
+        with os.scandir(trajectory_path) as entries:
+            for item in entries:
+                if item.name.endswith('.plt') and item.is_file():
+                    stat = item.stat()
+                    entry['files'].append((item.name, stat.st_size, stat.st_mtime))
+        entry['files'].sort()
+    return entry
+
+
+def is_current(data_path, entry):
+    # True if the cached entry still describes the user directory
+    user_path = os.path.join(data_path, entry['user_id'])
+    trajectory_path = os.path.join(user_path, 'Trajectory')
+    try:
+        if os.stat(user_path).st_mtime_ns != entry['mtime_ns']:
+            return False
+        trajectory_mtime_ns = os.stat(trajectory_path).st_mtime_ns if os.path.isdir(trajectory_path) else None
+    except FileNotFoundError:
+        return False
+    return trajectory_mtime_ns == entry['trajectory_mtime_ns']
+
+
+def load_cache(cache_path, data_path):
+    # {user_id: entry} from an earlier scan of data_path, or {} if there is none
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('data_path') != data_path:
+        return {}
+    return {entry['user_id']: entry for entry in cache['users']}
+
+
+def save_cache(cache_path, data_path, entries):
+    # Written to a temporary file first, so a reader never sees half a cache
+    temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({'data_path': data_path, 'users': entries}, f)
+    os.replace(temp_path, cache_path)
+
+
+class DatasetManifest:
+    """
+    Users, trajectory files and label files of a dataset, from DatasetManifest.scan:
+    - users: user ids, sorted
+    - plt_files: PltFile tuples, sorted by user and file name
+    - label_files: {user_id: absolute path of labels.txt}
+    """
+
+    def __init__(self, dataset_path, entries):
+        self.dataset_path = dataset_path
+        self.data_path = os.path.join(dataset_path, 'dataset', 'Data')
+        self.users = [entry['user_id'] for entry in entries]
+        self.plt_files = [
+            PltFile(entry['user_id'], os.path.join(entry['user_id'], 'Trajectory', name), size, mtime)
+            for entry in entries
+            for name, size, mtime in entry['files']
+        ]
+        self.label_files = {entry['user_id']: os.path.join(self.data_path, entry['user_id'], 'labels.txt')
+                            for entry in entries if entry['labels']}
+        # Users taken from the cache instead of being scanned again
+        self.cached_users = 0
+
+    @classmethod
+    def scan(cls, dataset_path, workers=None, cache_path=DEFAULT_CACHE_PATH):
+        # cache_path=None scans everything and leaves the cache alone
+        data_path = os.path.abspath(os.path.join(dataset_path, 'dataset', 'Data'))
+        with os.scandir(data_path) as entries:
+            user_ids = sorted(entry.name for entry in entries if entry.is_dir())
+        cached = load_cache(cache_path, data_path) if cache_path else {}
+
+        def scan_or_reuse(user_id):
+            entry = cached.get(user_id)
+            if entry is not None and is_current(data_path, entry):
+                return entry, True
+            return scan_user(data_path, user_id), False
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(scan_or_reuse, user_ids))
+        entries = [entry for entry, _ in results]
+        if cache_path:
+            save_cache(cache_path, data_path, entries)
+        manifest = cls(dataset_path, entries)
+        manifest.cached_users = sum(reused for _, reused in results)
+        return manifest
+
+    def absolute_path(self, plt_file):
+        return os.path.join(self.data_path, plt_file.path)
+
+    def total_size(self):
+        return sum(plt_file.size for plt_file in self.plt_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a dataset tree and show what main.py would load.")
+    parser.add_argument('--dataset-path', default='dataset',
+                        help="Directory containing dataset/Data (default: dataset)")
+    parser.add_argument('--workers', type=int, default=None, help="Threads scanning user directories")
+    parser.add_argument('--no-cache', action='store_true', help=f"Scan everything, ignoring {DEFAULT_CACHE_PATH}")
+    args = parser.parse_args()
+
+    manifest = DatasetManifest.scan(args.dataset_path, args.workers, None if args.no_cache else DEFAULT_CACHE_PATH)
+    print(tabulate([(len(manifest.users), len(manifest.label_files), len(manifest.plt_files),
+                     round(manifest.total_size() / 1024 / 1024, 2), manifest.cached_users)],
+                   headers=['Users', 'Label Files', 'Trajectory Files', 'Size (MiB)', 'Users From Cache'],
+                   tablefmt='psql'))
+
+if __name__ == '__main__':
+    main()
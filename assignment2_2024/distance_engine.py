@@ -0,0 +1,130 @@
+import numpy as np
+from trackpoint_schema import order_column
+
+# Same mean earth radius as the haversine package, so results match query 7's old per-pair loop
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Vectorized haversine distance in kilometers between arrays of points in degrees
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class DistanceAccumulator:
+    """
+    Sums the distance between consecutive trackpoints per activity. Takes chunks of
+    (activity_id, lat, lon) rows ordered by activity and trackpoint order; the last
+    point of each chunk is carried over, so activities may span chunk boundaries.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.last_point = None
+
+    def add_chunk(self, rows):
+        if not rows:
+            return
+        activity_ids, lats, lons = zip(*rows)
+        activity_ids = np.array(activity_ids, dtype=np.int64)
+        lats = np.array(lats, dtype=np.float64)
+        lons = np.array(lons, dtype=np.float64)
+        if self.last_point is not None:
+            activity_ids = np.concatenate(([self.last_point[0]], activity_ids))
+            lats = np.concatenate(([self.last_point[1]], lats))
+            lons = np.concatenate(([self.last_point[2]], lons))
+
+        # Only pairs within the same activity count as segments
+        same_activity = activity_ids[1:] == activity_ids[:-1]
+        segment_km = haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        ids, inverse = np.unique(activity_ids[1:][same_activity], return_inverse=True)
+        sums = np.bincount(inverse, weights=segment_km[same_activity], minlength=len(ids))
+
+        # Activities with a single point still get a (zero) total
+        for activity_id in np.unique(activity_ids):
+            self.totals.setdefault(int(activity_id), 0.0)
+        for activity_id, km in zip(ids.tolist(), sums.tolist()):
+            self.totals[activity_id] += km
+
+        self.last_point = (activity_ids[-1], lats[-1], lons[-1])
+
+
+class DistanceEngine:
+    """
+    Distance totals over trackpoint streams from part2.ActivityTrackerProgram.
+    Trackpoints are streamed with iter_query_chunks, so memory use depends on the
+    chunk size and the number of activities, not the number of trackpoints.
+    where/params filter Activity (alias a), e.g. "a.transportation_mode = %s", ('walk',).
+    """
+
+    def __init__(self, program, chunk_size=50000):
+        self.program = program
+        self.chunk_size = chunk_size
+
+    def per_activity(self, where=None, params=None):
+        # {activity_id: km}
+        query = f"""
+        SELECT t.activity_id, t.lat, t.lon
+        FROM TrackPoint t
+        JOIN Activity a ON t.activity_id = a.id
+        {'WHERE ' + where if where else ''}
+        ORDER BY t.activity_id, t.{order_column(self.program.cursor)}
+        """
+        accumulator = DistanceAccumulator()
+        for rows in self.program.iter_query_chunks(query, params, self.chunk_size):
+            accumulator.add_chunk(rows)
+        return accumulator.totals
+
+    def _grouped(self, column, where=None, params=None):
+        totals = self.per_activity(where, params)
+        query = f"""
+        SELECT a.id, {column}
+        FROM Activity a
+        {'WHERE ' + where if where else ''}
+        """
+        grouped = {}
+        for activity_id, key in self.program.iter_query(query, params):
+            if activity_id in totals:
+                grouped[key] = grouped.get(key, 0.0) + totals[activity_id]
+        return grouped
+
+    def per_user(self, where=None, params=None):
+        return self._grouped('a.user_id', where, params)
+
+    def per_mode(self, where=None, params=None):
+        return self._grouped('a.transportation_mode', where, params)
+
+    def per_year(self, where=None, params=None):
+        return self._grouped('YEAR(a.start_date_time)', where, params)
+
+    def rank_users(self, where=None, params=None, limit=20):
+        # [(user_id, km), ...] with the longest total distance first
+        ranking = sorted(self.per_user(where, params).items(), key=lambda item: item[1], reverse=True)
+        return ranking[:limit]
+
+
+def main():
+    from part2 import ActivityTrackerProgram
+
+    program = None
+    try:
+        program = ActivityTrackerProgram()
+        engine = DistanceEngine(program)
+        print("Top 20 users by total distance:")
+        program.print_query_results(
+            [(user_id, round(km, 2)) for user_id, km in engine.rank_users()],
+            ['User ID', 'Total Distance (km)'])
+        print("Total distance per transportation mode:")
+        program.print_query_results(
+            sorted(((mode, round(km, 2)) for mode, km in engine.per_mode().items()),
+                   key=lambda row: row[1], reverse=True),
+            ['Transportation Mode', 'Total Distance (km)'])
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        if program:
+            program.connection.close_connection()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import contextlib
+import io
+import time
+from indexes import INDEXES, create_indexes, drop_indexes
+from part2 import ActivityTrackerProgram, REPORT_QUERIES
+from tabulate import tabulate
+
+# Runs every part2 query without and with the secondary indexes from indexes.py.
+# Reports the latency of each query and writes the EXPLAIN ANALYZE plans of
+# both runs to a text file. The indexes are left in place afterwards.
+
+
+def run_queries(program, label):
+    latencies = {}
+    plans = {}
+    for number, method_name in REPORT_QUERIES:
+        method = getattr(program, method_name)
+        # The report output is not of interest here
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            method()
+            latencies[number] = time.perf_counter() - start
+
+            program.plan_log = []
+            method()
+            plans[number] = program.plan_log
+            program.plan_log = None
+        print(f"[{label}] query {number}: {latencies[number]:.3f}s")
+    return latencies, plans
+
+
+def write_plans(path, phases):
+    with open(path, 'w') as f:
+        for label, plans in phases:
+            for number, _ in REPORT_QUERIES:
+                for query, plan in plans[number]:
+                    f.write(f"===== Query {number}, {label} =====\n")
+                    f.write(query.strip() + "\n\n")
+                    f.write(plan + "\n\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare part2 query plans and latencies without and with secondary indexes.")
+    parser.add_argument('--plans', default='index_benchmark_plans.txt', help="Where to write the EXPLAIN ANALYZE output")
+    args = parser.parse_args()
+
+    program = None
+    try:
+        # The summary tables would answer queries 1-6 and 11 without touching the indexed tables
+        program = ActivityTrackerProgram(use_summaries=False)
+        drop_indexes(program.db_connection, program.cursor)
+        before, before_plans = run_queries(program, "without indexes")
+        create_indexes(program.db_connection, program.cursor)
+        after, after_plans = run_queries(program, "with indexes")
+
+        rows = []
+        for number, method_name in REPORT_QUERIES:
+            delta = after[number] - before[number]
+            speedup = before[number] / after[number] if after[number] else None
+            rows.append((number, method_name, round(before[number], 3), round(after[number], 3),
+                         round(delta, 3), round(speedup, 2) if speedup else None))
+        print(f"\nIndexes: {', '.join(name for _, name, _, _ in INDEXES)}")
+        print(tabulate(rows, headers=['Query', 'Method', 'Before (s)', 'After (s)', 'Delta (s)', 'Speedup'],
+                       tablefmt='psql'))
+
+        write_plans(args.plans, [("without indexes", before_plans), ("with indexes", after_plans)])
+        print(f"EXPLAIN ANALYZE output written to {args.plans}")
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        if program:
+            program.connection.close_connection()
+
+if __name__ == '__main__':
+    main()
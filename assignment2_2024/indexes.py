@@ -0,0 +1,88 @@
+# Secondary indexes for the part2 queries. They are created after the bulk load
+# rather than in create_tables, so the inserts do not have to maintain them.
+# (table, index name, indexed columns, index type)
+from backends import dialect_of
+from partitions import is_partitioned
+
+INDEXES = [
+    ('Activity', 'idx_activity_user_start', '(user_id, start_date_time)', 'INDEX'),
+    ('Activity', 'idx_activity_mode', '(transportation_mode)', 'INDEX'),
+    ('TrackPoint', 'idx_trackpoint_activity_id', '(activity_id, id)', 'INDEX'),
+    # R-tree over the generated POINT(lon, lat) column, used by spatial.py
+    ('TrackPoint', 'idx_trackpoint_location', '(location)', 'SPATIAL INDEX'),
+]
+
+# MySQL silently drops the index it created for a foreign key once an index from
+# INDEXES starts with the same column, and then refuses to drop that one. These
+# plain indexes take over while the INDEXES entry is dropped (drop_indexes) and are
+# removed again once it exists (create_indexes). {index they stand in for: index}
+FOREIGN_KEY_INDEXES = {
+    'idx_activity_user_start': ('Activity', 'idx_activity_user_id', '(user_id)', 'INDEX'),
+    'idx_trackpoint_activity_id': ('TrackPoint', 'idx_trackpoint_activity', '(activity_id)', 'INDEX'),
+}
+
+
+def existing_indexes(cursor):
+    if dialect_of(cursor) == 'sqlite':
+        cursor.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'")
+        return {(table.lower(), index.lower()) for table, index in cursor.fetchall()}
+    cursor.execute("""SELECT DISTINCT table_name, index_name
+                      FROM information_schema.statistics
+                      WHERE table_schema = DATABASE()""")
+    return {(table.lower(), index.lower()) for table, index in cursor.fetchall()}
+
+
+def table_columns(cursor, table):
+    if dialect_of(cursor) == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in cursor.fetchall()]
+    cursor.execute("""SELECT column_name FROM information_schema.columns
+                      WHERE table_schema = DATABASE() AND table_name = %s
+                      ORDER BY ordinal_position""", (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_indexes(db_connection, cursor, indexes=INDEXES):
+    existing = existing_indexes(cursor)
+    columns_of = {}
+    for table, name, columns, index_type in indexes:
+        if (table.lower(), name.lower()) in existing:
+            continue
+        if table not in columns_of:
+            columns_of[table] = {column.lower() for column in table_columns(cursor, table)}
+        # The compact TrackPoint layout has no id column; its primary key already
+        # orders the rows by activity (see trackpoint_schema.py)
+        if not {column.strip().lower() for column in columns.strip('()').split(',')} <= columns_of[table]:
+            continue
+        if index_type == 'SPATIAL INDEX' and dialect_of(cursor) != 'mysql':
+            continue  # No geometry column outside MySQL, see spatial.py
+        print(f"Creating index {name} on {table}{columns}...")
+        cursor.execute(f"ALTER TABLE {table} ADD {index_type} {name} {columns}")
+        existing.add((table.lower(), name.lower()))
+    # The foreign keys are backed by the new indexes now
+    for name, (table, backing_name, _, _) in FOREIGN_KEY_INDEXES.items():
+        if (table.lower(), name.lower()) in existing and (table.lower(), backing_name.lower()) in existing:
+            print(f"Dropping index {backing_name} on {table}...")
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {backing_name}")
+    db_connection.commit()
+
+
+def drop_indexes(db_connection, cursor, indexes=INDEXES):
+    existing = existing_indexes(cursor)
+    for table, name, _, _ in indexes:
+        if (table.lower(), name.lower()) not in existing:
+            continue
+        backing = FOREIGN_KEY_INDEXES.get(name)
+        if backing and dialect_of(cursor) == 'mysql' and not is_partitioned(cursor, table):
+            # Without it MySQL refuses to drop the index that backs the foreign key
+            _, backing_name, columns, index_type = backing
+            if (table.lower(), backing_name.lower()) not in existing:
+                print(f"Creating index {backing_name} on {table}{columns}...")
+                cursor.execute(f"ALTER TABLE {table} ADD {index_type} {backing_name} {columns}")
+        print(f"Dropping index {name} on {table}...")
+        cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}")
+    db_connection.commit()
+    # Fail rather than benchmark a table that still has the index
+    left = existing_indexes(cursor) & {(table.lower(), name.lower()) for table, name, _, _ in indexes}
+    if left:
+        raise RuntimeError(f"Indexes still present after dropping: {', '.join(name for _, name in sorted(left))}")
@@ -0,0 +1,73 @@
+import bisect
+import datetime
+
+
+class LabelIndex:
+    """
+    Lookup structure over one user's labels, as (start_time, end_time, mode) tuples.
+    Exact (start, end) matches are answered from a hash map. Matches with a time
+    tolerance, and activities that lie inside a label, use the labels sorted by
+    start time, so each lookup is O(log n) instead of a scan over every label.
+    """
+
+    def __init__(self, labels):
+        # When several labels share the same interval the first one in the file wins,
+        # like the linear scan this replaces
+        self.exact = {}
+        for start_time, end_time, mode in labels:
+            self.exact.setdefault((start_time, end_time), mode)
+
+        self.sorted_labels = sorted(labels, key=lambda label: label[0])
+        self.starts = [label[0] for label in self.sorted_labels]
+        # max_end_index[i] is the position of the label with the latest end time
+        # among sorted_labels[:i + 1]
+        self.max_end_index = []
+        best = None
+        for i, (_, end_time, _) in enumerate(self.sorted_labels):
+            if best is None or end_time > self.sorted_labels[best][1]:
+                best = i
+            self.max_end_index.append(best)
+
+    def match(self, start_time, end_time, tolerance=0, containment=False):
+        # tolerance is in seconds. Returns the matching mode, or None.
+        mode = self.exact.get((start_time, end_time))
+        if mode is not None:
+            return mode
+
+        slack = datetime.timedelta(seconds=tolerance)
+        if tolerance:
+            mode = self._match_nearest(start_time, end_time, slack)
+            if mode is not None:
+                return mode
+        if containment:
+            return self._match_containing(start_time, end_time, slack)
+        return None
+
+    def _match_nearest(self, start_time, end_time, slack):
+        # The label whose start and end are both within slack, closest overall
+        lo = bisect.bisect_left(self.starts, start_time - slack)
+        hi = bisect.bisect_right(self.starts, start_time + slack)
+        best_mode, best_distance = None, None
+        for label_start, label_end, mode in self.sorted_labels[lo:hi]:
+            end_distance = abs(label_end - end_time)
+            if end_distance > slack:
+                continue
+            distance = abs(label_start - start_time) + end_distance
+            if best_distance is None or distance < best_distance:
+                best_mode, best_distance = mode, distance
+        return best_mode
+
+    def _match_containing(self, start_time, end_time, slack):
+        # A label that starts before and ends after the activity, within slack
+        hi = bisect.bisect_right(self.starts, start_time + slack)
+        if hi == 0:
+            return None
+        _, label_end, mode = self.sorted_labels[self.max_end_index[hi - 1]]
+        if label_end >= end_time - slack:
+            return mode
+        return None
+
+
+def build_label_indexes(labels):
+    # labels is the {user_id: [(start_time, end_time, mode), ...]} dict from read_labels
+    return {user_id: LabelIndex(user_labels) for user_id, user_labels in labels.items()}
@@ -0,0 +1,78 @@
+import datetime
+import os
+import tempfile
+
+
+TRACKPOINT_COLUMNS = ('activity_id', 'lat', 'lon', 'altitude', 'date_days', 'date_time')
+
+
+class ExecuteManyLoader:
+    """
+    Inserts rows with a parameterized INSERT through cursor.executemany().
+    The caller is responsible for committing.
+    """
+    name = 'executemany'
+    batch_size = 1000
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def load(self, table, columns, rows):
+        placeholders = ', '.join(['%s'] * len(columns))
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self.cursor.executemany(query, rows)
+
+
+class InfileLoader:
+    """
+    Writes rows to a temporary tab-separated staging file and bulk loads it with
+    LOAD DATA LOCAL INFILE. Needs allow_local_infile on the client connection and
+    local_infile=1 on the server. The caller is responsible for committing.
+    """
+    name = 'infile'
+    batch_size = 50000
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def load(self, table, columns, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, newline='') as f:
+            staging_path = f.name
+            for row in rows:
+                f.write('\t'.join(format_infile_value(value) for value in row))
+                f.write('\n')
+        try:
+            # MySQL wants forward slashes in the file name, also on Windows
+            query = f"""LOAD DATA LOCAL INFILE '{staging_path.replace(os.sep, '/')}'
+                        INTO TABLE {table}
+                        FIELDS TERMINATED BY '\\t'
+                        LINES TERMINATED BY '\\n'
+                        ({', '.join(columns)})"""
+            self.cursor.execute(query)
+        finally:
+            os.remove(staging_path)
+
+
+def format_infile_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, float):
+        return repr(value)
+    # Escape the characters that LOAD DATA treats specially
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+LOADERS = {
+    ExecuteManyLoader.name: ExecuteManyLoader,
+    InfileLoader.name: InfileLoader,
+}
+
+
+def get_loader(name, cursor):
+    if name not in LOADERS:
+        raise ValueError(f"Unknown loader '{name}', expected one of: {', '.join(LOADERS)}")
+    return LOADERS[name](cursor)
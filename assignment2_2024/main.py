@@ -1,14 +1,159 @@
+import argparse
 import datetime
+import itertools
+import multiprocessing
 import os
-from DbConnector import DbConnector
+import time
+from backends import BACKENDS, get_connector
+from batch_writer import BatchWriter
+from discovery import DEFAULT_CACHE_PATH, DatasetManifest
+from indexes import create_indexes
+from label_index import build_label_indexes
+from loaders import LOADERS, get_loader
+from metrics import Metrics, profiled
+from partitions import partition_clause
+from query_cache import bump_dataset_version
+from segments import SEGMENT_COLUMNS, compute_segments
+from summaries import SummaryTables
 from tabulate import tabulate
+from timeparse import parse_label_datetime, parse_plt_datetime
+from trackpoint_schema import LAYOUTS, LOAD_COLUMNS, to_load_rows, trackpoint_layout, trackpoint_table_sql
+
+# Lines before the trajectory rows of a .plt file
+PLT_HEADER_LINES = 6
+# Files with more trajectory rows than this are skipped
+MAX_TRACKPOINTS = 2500
+
+
+def iter_plt_lines(f, max_rows=MAX_TRACKPOINTS):
+    # Yields (line_number, line) for the trajectory rows of an open .plt file. Reads
+    # lazily past the header and stops after row max_rows + 1, so telling an
+    # oversized file apart never reads the rest of it.
+    rows = itertools.islice(f, PLT_HEADER_LINES, PLT_HEADER_LINES + max_rows + 1)
+    yield from enumerate(rows, start=PLT_HEADER_LINES + 1)
+
+
+def parse_plt_file(task):
+    # Parses one trajectory file. Runs in the worker processes when ingesting in
+    # parallel, so it must stay a module-level function that only touches its arguments.
+    # Returns (activity_id, user_id, activity_data, trackpoints, segments, file_path,
+    # issues, parse_seconds); activity_data, trackpoints and segments are None if the
+    # file is skipped. issues are (kind, message) pairs for the parent's Metrics.warn.
+    user_id, activity_id, file_path = task
+    start = time.perf_counter()
+    issues = []
+    activity_data, trackpoints = _parse_plt_lines(file_path, activity_id, issues)
+    segments = compute_segments(activity_id, user_id, trackpoints) if trackpoints else None
+    return (activity_id, user_id, activity_data, trackpoints, segments, file_path,
+            issues, time.perf_counter() - start)
+
+
+def _parse_plt_lines(file_path, activity_id, issues):
+    # Problems are appended to issues as (kind, message) instead of printed
+    try:
+        with open(file_path, 'r') as f:
+            # At most MAX_TRACKPOINTS + 1 lines, however long the file is
+            lines = list(iter_plt_lines(f))
+
+            if len(lines) > MAX_TRACKPOINTS:
+                issues.append(('too_many_trackpoints',
+                               f"Skipping file {file_path} due to too many trackpoints (more than {MAX_TRACKPOINTS})."))
+                return None, None  # Rejected before parsing any of its rows
+
+            trackpoints = []
+
+            for line_num, line in lines:
+                parts = line.strip().split(',')
+                if len(parts) < 7:
+                    issues.append(('short_line', f"Line {line_num} in {file_path} has fewer than 7 columns. Skipping this line."))
+                    continue
+                try:
+                    lat, lon = float(parts[0]), float(parts[1])
+                    altitude = int(float(parts[3]))
+                    date_days = float(parts[4])
+                    date_time = parse_plt_datetime(parts[5], parts[6])
+                except ValueError as e:
+                    issues.append(('bad_line', f"Error processing line {line_num} in file {file_path}: {e}. "
+                                               f"Line content: {line.strip()}"))
+                    continue
+
+                trackpoints.append((activity_id, lat, lon, altitude, date_days, date_time))
+
+            if not trackpoints:
+                issues.append(('no_trackpoints', f"Missing start or end time in file {file_path}."))
+                return None, None
+
+            activity_data = {
+                'start_date_time': trackpoints[0][5],
+                'end_date_time': trackpoints[-1][5]
+            }
+            return activity_data, trackpoints
+    except Exception as e:
+        issues.append(('file_error', f"Error processing file {file_path}: {e}"))
+        return None, None
+
 
 class ActivityTrackerProgram:
 
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, loader='executemany', batch_rows=1000, batch_bytes=1024 * 1024,
+                 label_tolerance=0, label_containment=False, metrics=None, backend='mysql',
+                 schema='standard', compress=False, partitioned=False, discovery_cache=DEFAULT_CACHE_PATH):
+        if loader == 'infile' and backend != 'mysql':
+            raise ValueError("The infile loader needs the MySQL backend")
+        if compress and backend != 'mysql':
+            raise ValueError("Compressed pages need the MySQL backend")
+        if partitioned and backend != 'mysql':
+            raise ValueError("Partitioned tables need the MySQL backend")
+        self.connection = get_connector(backend)
+        # Stage timers, counters and rate-limited warnings, see metrics.py
+        self.metrics = metrics or Metrics()
         self.db_connection = self.connection.db_connection
         self.cursor = self.connection.cursor
+        # How activities are matched to labels, see LabelIndex.match
+        self.label_tolerance = label_tolerance
+        self.label_containment = label_containment
+        # Layout for a new TrackPoint table, see trackpoint_schema.py. An existing
+        # table keeps its layout; create_tables records which one it has.
+        self.schema = schema
+        self.compress = compress
+        # Monthly range partitions for new Activity and TrackPoint tables, see partitions.py
+        self.partitioned = partitioned
+        # Scan of the dataset tree shared by all stages, see discover
+        self.discovery_cache = discovery_cache
+        self.dataset_manifest = None
+        self.trackpoint_layout = schema
+        # Per-user rollups for the part2 reports, see summaries.py
+        self.summaries = SummaryTables(self.db_connection, self.cursor)
+        # Users whose activities were added, replaced or removed by the last load
+        self.changed_users = set()
+        # Labels currently loaded into LabelStaging, see stage_labels
+        self.staged_labels = None
+        # Backend used for the TrackPoint bulk inserts, see loaders.py
+        self.trackpoint_loader = get_loader(loader, self.cursor)
+        # Buffered multi-row writers for the User and Activity tables, committed per batch
+        self.user_writer = BatchWriter(
+            self.db_connection, self.cursor, "INSERT INTO User (id, has_labels)", 2,
+            suffix="ON DUPLICATE KEY UPDATE has_labels = VALUES(has_labels)",
+            max_rows=batch_rows, max_bytes=batch_bytes)
+        self.activity_writer = BatchWriter(
+            self.db_connection, self.cursor,
+            "INSERT INTO Activity (id, user_id, transportation_mode, start_date_time, end_date_time)", 5,
+            # Committed by insert_trackpoints_batch together with the rows of their files
+            max_rows=batch_rows, max_bytes=batch_bytes, commit_on_flush=False)
+        # Activities always exist when their mode is set, so the upsert only ever updates.
+        # start_date_time is part of the primary key of a partitioned Activity table.
+        self.transportation_mode_writer = BatchWriter(
+            self.db_connection, self.cursor, "INSERT INTO Activity (id, start_date_time, transportation_mode)", 3,
+            suffix="ON DUPLICATE KEY UPDATE transportation_mode = VALUES(transportation_mode)",
+            max_rows=batch_rows, max_bytes=batch_bytes)
+        # Manifest entries are only ever flushed together with the rows of their
+        # files, in insert_trackpoints_batch, so there is no row threshold
+        self.manifest_writer = BatchWriter(
+            self.db_connection, self.cursor,
+            "INSERT INTO IngestManifest (path, activity_id, size, mtime, row_count, ingested_at)", 6,
+            suffix="""ON DUPLICATE KEY UPDATE activity_id = VALUES(activity_id), size = VALUES(size),
+                      mtime = VALUES(mtime), row_count = VALUES(row_count), ingested_at = VALUES(ingested_at)""",
+            max_rows=float('inf'), max_bytes=float('inf'))
 
     def create_tables(self):
         user_query = """CREATE TABLE IF NOT EXISTS User (
@@ -23,46 +168,87 @@ class ActivityTrackerProgram:
                             end_date_time DATETIME,
                             FOREIGN KEY (user_id) REFERENCES User(id))
                          """
-        trackpoint_query = """CREATE TABLE IF NOT EXISTS TrackPoint (
-                              id INT AUTO_INCREMENT NOT NULL PRIMARY KEY,
-                              activity_id BIGINT,
-                              lat DOUBLE,
-                              lon DOUBLE,
-                              altitude INT,
-                              date_days DOUBLE,
-                              date_time DATETIME,
-                              FOREIGN KEY (activity_id) REFERENCES Activity(id))
-                           """
-        
+        # Partitioned tables can neither have nor be the target of foreign keys
+        segment_foreign_key = ", FOREIGN KEY (activity_id) REFERENCES Activity(id)"
+        if self.partitioned:
+            activity_query = f"""CREATE TABLE IF NOT EXISTS Activity (
+                                id BIGINT NOT NULL,
+                                user_id VARCHAR(255),
+                                transportation_mode VARCHAR(255),
+                                start_date_time DATETIME NOT NULL,
+                                end_date_time DATETIME,
+                                PRIMARY KEY (id, start_date_time))
+                                {partition_clause('start_date_time')}
+                             """
+            segment_foreign_key = ""
+        mysql = self.connection.dialect == 'mysql'
+        trackpoint_query = trackpoint_table_sql(self.connection.dialect, self.schema, self.compress,
+                                                partitioned=self.partitioned)
+        # One row per pair of consecutive trackpoints, see segments.py. Lets the
+        # altitude and time gap queries aggregate a single table instead of self-joining TrackPoint.
+        segment_query = f"""CREATE TABLE IF NOT EXISTS TrackPointSegment (
+                           activity_id BIGINT NOT NULL,
+                           seq INT NOT NULL,
+                           user_id VARCHAR(255),
+                           altitude_diff INT,
+                           time_diff_seconds INT,
+                           distance_km DOUBLE,
+                           PRIMARY KEY (activity_id, seq){segment_foreign_key})
+                        """
+        # One row per ingested .plt file, used by incremental loads to find new or
+        # changed files. activity_id is NULL for files that were skipped.
+        manifest_query = f"""CREATE TABLE IF NOT EXISTS IngestManifest (
+                            path VARCHAR(512) NOT NULL PRIMARY KEY,
+                            activity_id BIGINT,
+                            size BIGINT,
+                            mtime DOUBLE,
+                            row_count INT,
+                            ingested_at DATETIME{', KEY (activity_id)' if mysql else ''})
+                         """
+
         self.cursor.execute(user_query)
         self.cursor.execute(activity_query)
         self.cursor.execute(trackpoint_query)
+        self.cursor.execute(segment_query)
+        self.cursor.execute(manifest_query)
+        if not mysql:
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_manifest_activity ON IngestManifest (activity_id)")
         self.db_connection.commit()
+        self.trackpoint_layout = trackpoint_layout(self.cursor)
+        self.summaries.create_tables()
 
     def insert_user_data(self, user_id, has_labels):
-        query = "INSERT INTO User (id, has_labels) VALUES (%s, %s)"
-        self.cursor.execute(query, (user_id, has_labels))
-        self.db_connection.commit()
+        # Buffered, written when user_writer is flushed
+        self.user_writer.add((user_id, has_labels))
 
     def insert_activity_data(self, activity_id, user_id, activity_data):
-        query = """INSERT INTO Activity 
-                    (id, user_id, transportation_mode, start_date_time, end_date_time) 
-                    VALUES (%s, %s, %s, %s, %s)"""
-        self.cursor.execute(query, (
+        # Buffered, written when activity_writer is flushed
+        self.activity_writer.add((
             int(activity_id),
             user_id,
             None,  # transportation_mode is not provided in the file
             activity_data['start_date_time'],
             activity_data['end_date_time']
         ))
-        self.db_connection.commit()
-        
-    def insert_trackpoints_batch(self, trackpoints):
-        query = """INSERT INTO TrackPoint 
-                   (activity_id, lat, lon, altitude, date_days, date_time) 
-                   VALUES (%s, %s, %s, %s, %s, %s)"""
-        self.cursor.executemany(query, trackpoints)
-        self.db_connection.commit()
+
+    def insert_trackpoints_batch(self, trackpoints, segments=()):
+        try:
+            # Buffered activities go first in the same transaction, since the
+            # trackpoints and segments reference them. The manifest entries of the
+            # files are committed together with their rows, so an interrupted load
+            # can be resumed from the last committed batch.
+            with self.metrics.timer('insert'):
+                self.activity_writer.flush(commit=False)
+                if trackpoints:
+                    self.trackpoint_loader.load('TrackPoint', LOAD_COLUMNS[self.trackpoint_layout], trackpoints)
+                if segments:
+                    self.trackpoint_loader.load('TrackPointSegment', SEGMENT_COLUMNS, segments)
+                self.manifest_writer.flush(commit=False)
+            with self.metrics.timer('commit'):
+                self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
 
     def insert_trackpoint_data(self, activity_id, lat, lon, altitude, date_days, date_time):
         query = """INSERT INTO TrackPoint 
@@ -85,11 +271,32 @@ class ActivityTrackerProgram:
         self.cursor.execute(query)
         self.db_connection.commit()
 
+    def recreate_tables(self):
+        # Children before parents because of the foreign keys
+        self.summaries.drop_tables()
+        self.drop_table("LabelStaging")
+        self.drop_table("IngestManifest")
+        self.drop_table("TrackPointSegment")
+        self.drop_table("TrackPoint")
+        self.drop_table("Activity")
+        self.drop_table("User")
+        self.create_tables()
+
     def show_tables(self):
         self.cursor.execute("SHOW TABLES")
         rows = self.cursor.fetchall()
         print(tabulate(rows, headers=self.cursor.column_names))
 
+    def discover(self, dataset_path):
+        # Users, trajectory files and label files of the dataset, scanned once per
+        # program and shared by all stages, see discovery.py
+        if self.dataset_manifest is None or self.dataset_manifest.dataset_path != dataset_path:
+            with self.metrics.timer('discover'):
+                self.dataset_manifest = DatasetManifest.scan(dataset_path, cache_path=self.discovery_cache)
+            if self.discovery_cache:
+                self.metrics.count('users_from_discovery_cache', self.dataset_manifest.cached_users)
+        return self.dataset_manifest
+
     def populate_user_table(self, dataset_path):
         labeled_ids_path = os.path.join(dataset_path, 'dataset', 'labeled_ids.txt')
     
@@ -97,183 +304,175 @@ class ActivityTrackerProgram:
         with open(labeled_ids_path, 'r') as f:
             labeled_ids = set(f.read().splitlines())
         
-        # Track processed users
-        processed_users = set()
+        with self.user_writer:
+            for user_id in self.discover(dataset_path).users:
+                self.insert_user_data(user_id, user_id in labeled_ids)
         
-        # Walk through the directory structure
-        data_path = os.path.join(dataset_path, 'dataset', 'Data')
-        for root, dirs, files in os.walk(data_path):
-            for dir in dirs:
-                user_id = dir
-                if user_id == "Trajectory": # Skip the Trajectory "user"
-                    continue
-                if user_id in processed_users:
-                    continue  # Skip already processed users
+        print("User table populated successfully.")
+        
+    def iter_plt_files(self, dataset_path):
+        # Yields (user_id, activity_id, file_path, size, mtime) for every trajectory
+        # file, sorted by user and file name
+        manifest = self.discover(dataset_path)
+        for plt_file in manifest.plt_files:
+            activity_id_str = f"{plt_file.user_id}{os.path.splitext(os.path.basename(plt_file.path))[0]}"
+            try:
+                activity_id = int(activity_id_str)
+            except ValueError:
+                self.metrics.warn('invalid_activity_id', f"Invalid activity_id generated: {activity_id_str}")
+                continue
+            yield (plt_file.user_id, activity_id, manifest.absolute_path(plt_file),
+                   plt_file.size, plt_file.mtime)
 
-                has_labels = user_id in labeled_ids
+    def get_manifest(self):
+        self.cursor.execute("SELECT path, size, mtime FROM IngestManifest")
+        return {path: (size, mtime) for path, size, mtime in self.cursor.fetchall()}
 
-                # Insert new user data
-                self.insert_user_data(user_id, has_labels)
+    def delete_activity_data(self, activity_id):
+        # Removes a previously ingested activity so a changed file can be loaded again.
+        # Left uncommitted, it becomes part of the batch that reinserts the file.
+        self.cursor.execute("DELETE FROM TrackPointSegment WHERE activity_id = %s", (activity_id,))
+        self.cursor.execute("DELETE FROM TrackPoint WHERE activity_id = %s", (activity_id,))
+        self.cursor.execute("DELETE FROM Activity WHERE id = %s", (activity_id,))
 
-                # Mark user as processed
-                processed_users.add(user_id)
-        
-        print("User table populated successfully.")
-        
-    def populate_activity_table(self, dataset_path):
+    def iter_changed_plt_files(self, dataset_path, manifest, file_stats):
+        # Filters iter_plt_files down to files that are not in the manifest with
+        # the same size and mtime. Fills file_stats with path -> (size, mtime).
         data_path = os.path.join(dataset_path, 'dataset', 'Data')
-        for root, dirs, files in os.walk(data_path):
-            if 'Trajectory' in root:
-                user_id = os.path.basename(os.path.dirname(root))
-                for file in files:
-                    if file.endswith('.plt'):
-                        activity_id_str = f"{user_id}{os.path.splitext(file)[0]}"
-                        
-                        activity_id = int(activity_id_str)
-                        
-                        file_path = os.path.join(root, file)
-                        
-                        activity_data = self.process_activity_file(file_path)
-                        
-                        if activity_data:
-                            self.insert_activity_data(activity_id, user_id, activity_data)
-                        else:
-                            print(f"Skipped activity {activity_id} for user {user_id} due to too many trackpoints or missing data.")
-        
-        print("Activity table populated successfully.")
-        
-    def populate_trackpoint_table(self, dataset_path):
-        data_path = os.path.join(dataset_path, 'dataset', 'Data')
-        batch_size = 1000
+        for user_id, activity_id, file_path, size, mtime in self.iter_plt_files(dataset_path):
+            path = os.path.relpath(file_path, data_path)
+            file_stats[path] = (size, mtime)
+            if manifest.get(path) == file_stats[path]:
+                continue
+            yield user_id, activity_id, file_path
+
+    def delete_removed_files(self, manifest, file_stats):
+        # Files that are in the manifest but no longer on disk
+        removed = [path for path in manifest if path not in file_stats]
+        for path in removed:
+            self.cursor.execute("SELECT activity_id FROM IngestManifest WHERE path = %s", (path,))
+            row = self.cursor.fetchone()
+            if row and row[0] is not None:
+                self.delete_activity_data(row[0])
+            self.cursor.execute("DELETE FROM IngestManifest WHERE path = %s", (path,))
+            # Paths are <user_id>/Trajectory/<file>.plt
+            self.changed_users.add(path.split(os.sep)[0])
+        self.db_connection.commit()
+        if removed:
+            print(f"Removed {len(removed)} activities whose files no longer exist.")
+
+    def populate_activity_and_trackpoint_tables(self, dataset_path, workers=1, incremental=False):
+        # Single pass over the trajectory files: each .plt file is read and parsed
+        # once, producing both its Activity row and its TrackPoint rows.
+        # With workers > 1 the parsing is spread over a process pool, while this
+        # connection stays the only writer. imap hands results back in submission
+        # order, so the database ends up identical to a serial run.
+        # With incremental=True only files that are new or changed since they were
+        # recorded in IngestManifest are parsed, and their old rows are replaced.
+        batch_size = self.trackpoint_loader.batch_size
         trackpoints_batch = []
-        
-        for root, dirs, files in os.walk(data_path):
-            if 'Trajectory' in root:
-                user_id = os.path.basename(os.path.dirname(root))
-                for file in files:
-                    if file.endswith('.plt'):
-                        activity_id_str = f"{user_id}{os.path.splitext(file)[0]}"
-                        try:
-                            activity_id = int(activity_id_str)
-                        except ValueError:
-                            print(f"Invalid activity_id generated: {activity_id_str}")
-                            continue
-                        file_path = os.path.join(root, file)
-                        
-                        trackpoints = self.process_trackpoints(file_path, activity_id)
-                        
-                        if trackpoints:
-                            trackpoints_batch.extend(trackpoints)
-                            
-                            if len(trackpoints_batch) >= batch_size:
-                                self.insert_trackpoints_batch(trackpoints_batch)
-                                trackpoints_batch = []
-        
-        # Insert any remaining trackpoints
-        if trackpoints_batch:
-            self.insert_trackpoints_batch(trackpoints_batch)
-        
-        print("TrackPoint table populated successfully.")
-        
-    def process_activity_file(self, file_path):
+        segments_batch = []
+        data_path = os.path.join(dataset_path, 'dataset', 'Data')
+        manifest = self.get_manifest() if incremental else {}
+        self.changed_users = set()
+        file_stats = {}
+        # The walk is timed as the files are handed out; with workers it runs in the
+        # pool's task thread, interleaved with the parsing
+        tasks = self.metrics.timed_iter('walk', self.iter_changed_plt_files(dataset_path, manifest, file_stats))
+        loaded_files = 0
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(processes=workers)
+            results = pool.imap(parse_plt_file, tasks, chunksize=16)
+        else:
+            results = map(parse_plt_file, tasks)
+
+        finished = False
         try:
-            with open(file_path, 'r') as f:
-                lines = f.readlines()[6:]  # Skip first 6 lines
-                
-                if len(lines) > 2500:
-                    print(f"Skipping file {file_path} due to too many trackpoints ({len(lines)}).")
-                    return None  # Skip activities with more than 2500 trackpoints
-                
-                start_time = None
-                end_time = None
-                
-                for line_num, line in enumerate(lines, start=7):  # Start counting from 7 to account for skipped lines
-                    try:
-                        parts = line.strip().split(',')
-                        if len(parts) >= 7:
-                            # Ensure we have enough parts before accessing them
-                            lat, lon = parts[0], parts[1]
-                            altitude = parts[3]
-                            date = parts[5]
-                            time = parts[6]
-                            
-                            # Parse datetime
-                            date_string = f"{date} {time}"
-                            try:
-                                current_time = datetime.datetime.strptime(date_string, "%Y-%m-%d %H:%M:%S")
-                            except ValueError as e:
-                                print(f"Error parsing date {date_string} in file {file_path}, line {line_num}: {e}. Skipping this line.")
-                                continue
-                            
-                            if start_time is None:
-                                start_time = current_time
-                            end_time = current_time
-                        else:
-                            print(f"Warning: Line {line_num} in {file_path} has fewer than 7 columns. Skipping this line.")
-                    except Exception as e:
-                        print(f"Error processing line {line_num} in file {file_path}: {e}. Line content: {line.strip()}")
-                        continue
-
-                if start_time and end_time:
-                    return {
-                        'start_date_time': start_time,
-                        'end_date_time': end_time
-                    }
+            for (activity_id, user_id, activity_data, trackpoints, segments, file_path,
+                 issues, parse_seconds) in results:
+                path = os.path.relpath(file_path, data_path)
+                size, mtime = file_stats[path]
+                loaded_files += 1
+                # Summed over the workers, so it can exceed the wall-clock time
+                self.metrics.add_time('parse', parse_seconds)
+                self.metrics.count('files')
+                for kind, message in issues:
+                    self.metrics.warn(kind, message)
+                self.changed_users.add(user_id)
+                if incremental:
+                    # Replace whatever an earlier or interrupted run left for this file
+                    self.delete_activity_data(activity_id)
+
+                if not activity_data:
+                    self.metrics.count('files_skipped')
+                    self.manifest_writer.add((path, None, size, mtime, 0, datetime.datetime.now()))
+                    continue
+
+                # The Activity row must exist before its trackpoints reference it
+                self.insert_activity_data(activity_id, user_id, activity_data)
+                self.metrics.count('activities')
+                self.metrics.count('trackpoints', len(trackpoints))
+                self.metrics.count('segments', len(segments))
+                trackpoints_batch.extend(to_load_rows(trackpoints, self.trackpoint_layout))
+                segments_batch.extend(segments)
+                self.manifest_writer.add((path, activity_id, size, mtime, len(trackpoints), datetime.datetime.now()))
+
+                if len(trackpoints_batch) >= batch_size:
+                    self.insert_trackpoints_batch(trackpoints_batch, segments_batch)
+                    trackpoints_batch = []
+                    segments_batch = []
+
+            # Insert any remaining trackpoints, activities and manifest entries
+            self.insert_trackpoints_batch(trackpoints_batch, segments_batch)
+            if incremental:
+                self.delete_removed_files(manifest, file_stats)
+            finished = True
+        except Exception:
+            self.metrics.count('errors')
+            self.activity_writer.discard()
+            self.manifest_writer.discard()
+            self.db_connection.rollback()
+            raise
+        finally:
+            if pool:
+                if finished:
+                    pool.close()
                 else:
-                    print(f"Missing start or end time in file {file_path}.")
-                return None
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
-            return None
-        
-    def process_trackpoints(self, file_path, activity_id):
-        try:
-            with open(file_path, 'r') as f:
-                lines = f.readlines()[6:]  # Skip first 6 lines
-                
-                if len(lines) > 2500:
-                    return None  # Skip activities with more than 2500 trackpoints
-                
-                trackpoints = []
-                
-                for line in lines:
-                    parts = line.strip().split(',')
-                    if len(parts) >= 7:
-                        lat, lon = float(parts[0]), float(parts[1])
-                        altitude = int(float(parts[3]))
-                        date_days = float(parts[4])
-                        date_string = f"{parts[5]} {parts[6]}"
-                        date_time = datetime.datetime.strptime(date_string, "%Y-%m-%d %H:%M:%S")
-                        
-                        trackpoints.append((activity_id, lat, lon, altitude, date_days, date_time))
-
-                return trackpoints
-        except Exception as e:
-            print(f"Error processing trackpoints in file {file_path}: {e}")
-            return None
-    
-        
+                    # Failed or interrupted: stop the workers instead of letting them
+                    # parse the remaining files first
+                    pool.terminate()
+                pool.join()
+
+        if incremental:
+            print(f"Loaded {loaded_files} new or changed files, {len(file_stats) - loaded_files} unchanged files skipped.")
+        print("Activity and TrackPoint tables populated successfully.")
+
     def update_transportation_modes(self, dataset_path):
         labels = self.read_labels(dataset_path)
+        label_indexes = build_label_indexes(labels)
         users_with_labels = self.get_users_with_labels()
-        
-        for user_id in users_with_labels:
-            if user_id not in labels:
-                print(f"Error: User {user_id} has has_labels set to true, but no transportation labels were found.")
-                continue
-            
-            activities = self.get_user_activities(user_id)
-            labels_found = False
-            
-            for activity in activities:
-                transportation_mode = self.find_matching_label(user_id, activity, labels)
-                if transportation_mode:
-                    self.update_activity_transportation_mode(activity['id'], transportation_mode)
-                    labels_found = True
-            
-            if not labels_found:
-                print(f"Error: User {user_id} has has_labels set to true, but no matching transportation labels were found for any activities.")
 
+        with self.transportation_mode_writer:
+            for user_id in users_with_labels:
+                if user_id not in labels:
+                    self.metrics.warn('labels_missing', f"User {user_id} has has_labels set to true, but no transportation labels were found.")
+                    continue
+
+                activities = self.get_user_activities(user_id)
+                labels_found = False
+
+                for activity in activities:
+                    transportation_mode = self.find_matching_label(user_id, activity, label_indexes)
+                    if transportation_mode:
+                        self.update_activity_transportation_mode(activity, transportation_mode)
+                        labels_found = True
+
+                if not labels_found:
+                    self.metrics.warn('labels_unmatched', f"User {user_id} has has_labels set to true, but no matching transportation labels were found for any activities.")
+
+        self.summaries.refresh(users_with_labels)
         print("Transportation modes updated successfully.")
 
     def get_users_with_labels(self):
@@ -289,12 +488,9 @@ class ActivityTrackerProgram:
         return [{'id': row[0], 'start_date_time': row[1], 'end_date_time': row[2]} 
                 for row in self.cursor.fetchall()]
 
-    def update_activity_transportation_mode(self, activity_id, transportation_mode):
-        query = """UPDATE Activity 
-                   SET transportation_mode = %s 
-                   WHERE id = %s"""
-        self.cursor.execute(query, (transportation_mode, activity_id))
-        self.db_connection.commit()
+    def update_activity_transportation_mode(self, activity, transportation_mode):
+        # Buffered, written when transportation_mode_writer is flushed
+        self.transportation_mode_writer.add((activity['id'], activity['start_date_time'], transportation_mode))
 
     def read_labels(self, dataset_path):
         labels = {}
@@ -303,35 +499,35 @@ class ActivityTrackerProgram:
         with open(labeled_ids_path, 'r') as f:
             labeled_ids = set(f.read().splitlines())
         
+        label_files = self.discover(dataset_path).label_files
         for user_id in labeled_ids:
-            labels_file = os.path.join(dataset_path, 'dataset', 'Data', user_id, 'labels.txt')
-            if os.path.exists(labels_file):
+            labels_file = label_files.get(user_id)
+            if labels_file:
                 with open(labels_file, 'r') as f:
                     user_labels = []
-                    for line in f.readlines()[1:]:  # Skip header
+                    for line in itertools.islice(f, 1, None):  # Skip header
                         parts = line.strip().split('\t')
                         if len(parts) == 3:
-                            start_time = datetime.datetime.strptime(parts[0], "%Y/%m/%d %H:%M:%S")
-                            end_time = datetime.datetime.strptime(parts[1], "%Y/%m/%d %H:%M:%S")
+                            start_time = parse_label_datetime(parts[0])
+                            end_time = parse_label_datetime(parts[1])
                             mode = parts[2]
                             user_labels.append((start_time, end_time, mode))
                     labels[user_id] = user_labels
         
         return labels
 
-    def find_matching_label(self, user_id, activity, labels):
-        if user_id not in labels:
+    def find_matching_label(self, user_id, activity, label_indexes):
+        # label_indexes is the {user_id: LabelIndex} dict from build_label_indexes
+        if user_id not in label_indexes:
             return None
-        
-        for start_time, end_time, mode in labels[user_id]:
-            if (start_time == activity['start_date_time'] and 
-                end_time == activity['end_date_time']):
-                return mode
-        
-        return None
+
+        return label_indexes[user_id].match(activity['start_date_time'], activity['end_date_time'],
+                                            tolerance=self.label_tolerance,
+                                            containment=self.label_containment)
     
     def verify_transportation_modes(self, dataset_path):
         labels = self.read_labels(dataset_path)
+        label_indexes = build_label_indexes(labels)
         users_with_labels = self.get_users_with_labels()
         
         total_activities = 0
@@ -340,14 +536,14 @@ class ActivityTrackerProgram:
 
         for user_id in users_with_labels:
             if user_id not in labels:
-                print(f"Error: User {user_id} has has_labels set to true, but no labels file was found.")
+                self.metrics.warn('labels_missing', f"User {user_id} has has_labels set to true, but no labels file was found.")
                 continue
             
             activities = self.get_user_activities_with_transportation(user_id)
             
             for activity in activities:
                 total_activities += 1
-                label_mode = self.find_matching_label(user_id, activity, labels)
+                label_mode = self.find_matching_label(user_id, activity, label_indexes)
                 
                 if label_mode is not None:
                     if label_mode == activity['transportation_mode']:
@@ -360,8 +556,11 @@ class ActivityTrackerProgram:
                             'label_mode': label_mode
                         })
 
+        self.print_verification(total_activities, correct_activities, inconsistent_activities)
+
+    def print_verification(self, total_activities, correct_activities, inconsistent_activities):
         print(f"Verification complete. {correct_activities} out of {total_activities} activities with labels are correct.")
-        
+
         if inconsistent_activities:
             print("\nInconsistent activities found:")
             for activity in inconsistent_activities:
@@ -378,33 +577,240 @@ class ActivityTrackerProgram:
         return [{'id': row[0], 'start_date_time': row[1], 'end_date_time': row[2], 'transportation_mode': row[3]} 
                 for row in self.cursor.fetchall()]
 
+    def stage_labels(self, labels):
+        # Loads the parsed labels into the LabelStaging table, so they can be joined
+        # against Activity inside MySQL. INSERT IGNORE keeps the first label of
+        # duplicated intervals, like find_matching_label.
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS LabelStaging (
+                               user_id VARCHAR(255) NOT NULL,
+                               start_date_time DATETIME NOT NULL,
+                               end_date_time DATETIME NOT NULL,
+                               transportation_mode VARCHAR(255),
+                               PRIMARY KEY (user_id, start_date_time, end_date_time))
+                            """)
+        self.cursor.execute("TRUNCATE TABLE LabelStaging")
+        writer = BatchWriter(
+            self.db_connection, self.cursor,
+            "INSERT IGNORE INTO LabelStaging (user_id, start_date_time, end_date_time, transportation_mode)", 4,
+            max_rows=self.activity_writer.max_rows, max_bytes=self.activity_writer.max_bytes)
+        with writer:
+            for user_id, user_labels in labels.items():
+                for start_time, end_time, mode in user_labels:
+                    writer.add((user_id, start_time, end_time, mode))
+        self.staged_labels = labels
+
+    def update_transportation_modes_sql(self, dataset_path):
+        # Set-based variant of update_transportation_modes: one UPDATE ... JOIN against
+        # the staged labels instead of per-user fetches and per-activity updates.
+        # Only exact (start, end) matches are supported.
+        labels = self.read_labels(dataset_path)
+        self.stage_labels(labels)
+
+        for user_id in self.get_users_with_labels():
+            if user_id not in labels:
+                self.metrics.warn('labels_missing', f"User {user_id} has has_labels set to true, but no transportation labels were found.")
+
+        if self.connection.dialect == 'mysql':
+            update_query = """UPDATE Activity a
+                              JOIN LabelStaging l
+                                ON l.user_id = a.user_id
+                               AND l.start_date_time = a.start_date_time
+                               AND l.end_date_time = a.end_date_time
+                              SET a.transportation_mode = l.transportation_mode"""
+        else:
+            # SQLite has no UPDATE ... JOIN, but the same join as UPDATE ... FROM
+            update_query = """UPDATE Activity
+                              SET transportation_mode = l.transportation_mode
+                              FROM LabelStaging l
+                              WHERE l.user_id = Activity.user_id
+                                AND l.start_date_time = Activity.start_date_time
+                                AND l.end_date_time = Activity.end_date_time"""
+        try:
+            self.cursor.execute(update_query)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
+
+        # Labeled users where none of the activities got a label
+        self.cursor.execute("""SELECT u.id
+                               FROM User u
+                               WHERE u.has_labels = TRUE
+                               AND u.id IN (SELECT user_id FROM LabelStaging)
+                               AND NOT EXISTS (
+                                   SELECT 1
+                                   FROM Activity a
+                                   JOIN LabelStaging l
+                                     ON l.user_id = a.user_id
+                                    AND l.start_date_time = a.start_date_time
+                                    AND l.end_date_time = a.end_date_time
+                                   WHERE a.user_id = u.id)""")
+        for (user_id,) in self.cursor.fetchall():
+            self.metrics.warn('labels_unmatched', f"User {user_id} has has_labels set to true, but no matching transportation labels were found for any activities.")
+
+        self.summaries.refresh(self.get_users_with_labels())
+        print("Transportation modes updated successfully.")
+
+    def verify_transportation_modes_sql(self, dataset_path):
+        # Set-based variant of verify_transportation_modes: a single query returns every
+        # activity of the labeled users next to its staged label, if any
+        labels = self.staged_labels
+        if labels is None:
+            labels = self.read_labels(dataset_path)
+            self.stage_labels(labels)
+
+        for user_id in self.get_users_with_labels():
+            if user_id not in labels:
+                self.metrics.warn('labels_missing', f"User {user_id} has has_labels set to true, but no labels file was found.")
+
+        self.cursor.execute("""SELECT a.user_id, a.id, a.transportation_mode, l.transportation_mode
+                               FROM Activity a
+                               JOIN User u ON u.id = a.user_id
+                               LEFT JOIN LabelStaging l
+                                 ON l.user_id = a.user_id
+                                AND l.start_date_time = a.start_date_time
+                                AND l.end_date_time = a.end_date_time
+                               WHERE u.has_labels = TRUE""")
+
+        total_activities = 0
+        correct_activities = 0
+        inconsistent_activities = []
+        for user_id, activity_id, db_mode, label_mode in self.cursor.fetchall():
+            if user_id not in labels:
+                continue
+            total_activities += 1
+            if label_mode is not None:
+                if label_mode == db_mode:
+                    correct_activities += 1
+                else:
+                    inconsistent_activities.append({
+                        'user_id': user_id,
+                        'activity_id': activity_id,
+                        'db_mode': db_mode,
+                        'label_mode': label_mode
+                    })
+
+        self.print_verification(total_activities, correct_activities, inconsistent_activities)
+
         
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create and populate the GeoLife database.")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql',
+                        help="Database to load into: the MySQL server, or an embedded SQLite file "
+                             "(SQLITE_PATH, default geolife.sqlite) (default: mysql)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used to parse .plt files (default: 1, serial)")
+    parser.add_argument('--loader', choices=sorted(LOADERS), default='executemany',
+                        help="How TrackPoint rows are written: parameterized executemany INSERTs "
+                             "or LOAD DATA LOCAL INFILE from staging files (default: executemany)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Keep the existing tables and only load .plt files that are new or changed "
+                             "since the last run. Also resumes an interrupted load.")
+    parser.add_argument('--label-tolerance', type=float, default=0,
+                        help="Also match labels whose start and end are within this many seconds "
+                             "of an activity's (default: 0, exact matches only)")
+    parser.add_argument('--label-containment', action='store_true',
+                        help="Also match activities that lie inside a labeled interval")
+    parser.add_argument('--label-update', choices=['python', 'sql'], default='python',
+                        help="Match labels in Python per activity, or stage them in MySQL and update "
+                             "and verify with set-based queries (exact matches only) (default: python)")
+    parser.add_argument('--batch-rows', type=int, default=1000,
+                        help="Rows per multi-row User/Activity write and commit (default: 1000)")
+    parser.add_argument('--dataset-path', default='dataset',
+                        help="Directory holding dataset/labeled_ids.txt and dataset/Data (default: dataset)")
+    parser.add_argument('--batch-bytes', type=int, default=1024 * 1024,
+                        help="Approximate size limit of one multi-row write in bytes (default: 1 MiB)")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Write stage timings, counters and warning counts to this JSON file")
+    parser.add_argument('--profile', metavar='PATH', help="Run under cProfile and save the stats to this file")
+    parser.add_argument('--schema', choices=LAYOUTS, default='standard',
+                        help="Layout of a new TrackPoint table, see trackpoint_schema.py (default: standard)")
+    parser.add_argument('--compress', action='store_true',
+                        help="Create the TrackPoint table with InnoDB compressed pages (MySQL only)")
+    parser.add_argument('--partition', action='store_true',
+                        help="Partition new Activity and TrackPoint tables by month, see partitions.py (MySQL only)")
+    parser.add_argument('--no-discovery-cache', action='store_true',
+                        help=f"Scan the whole dataset tree instead of reusing {DEFAULT_CACHE_PATH} where it is current")
+    parser.add_argument('--warning-limit', type=int, default=10,
+                        help="Warnings of each kind printed before the rest are only counted (default: 10)")
+    args = parser.parse_args()
+    if args.label_update == 'sql' and (args.label_tolerance or args.label_containment):
+        parser.error("--label-tolerance and --label-containment need --label-update python")
+    if args.loader == 'infile' and args.backend != 'mysql':
+        parser.error("--loader infile needs --backend mysql")
+    if args.compress and args.backend != 'mysql':
+        parser.error("--compress needs --backend mysql")
+    if args.partition and args.backend != 'mysql':
+        parser.error("--partition needs --backend mysql")
+    return args
+
+
 def main():
+    args = parse_args()
+    metrics = Metrics(warning_limit=args.warning_limit)
     program = None
     try:
-        program = ActivityTrackerProgram()
-        program.drop_table("TrackPoint")
-        program.drop_table("Activity")
-        program.drop_table("User")
-        program.create_tables()
-        
-        dataset_path = 'dataset' 
-        program.populate_user_table(dataset_path)
-        program.populate_activity_table(dataset_path)
-        program.populate_trackpoint_table(dataset_path)
-        
-        program.fetch_data("User")
-        program.fetch_data("Activity")
-        program.show_tables()
-        
-        program.update_transportation_modes(dataset_path)
-        program.verify_transportation_modes(dataset_path)
+        with profiled(args.profile):
+            program = ActivityTrackerProgram(loader=args.loader, batch_rows=args.batch_rows,
+                                             batch_bytes=args.batch_bytes, label_tolerance=args.label_tolerance,
+                                             label_containment=args.label_containment, metrics=metrics,
+                                             backend=args.backend, schema=args.schema, compress=args.compress,
+                                             partitioned=args.partition,
+                                             # Incremental loads compare file sizes and mtimes, which the
+                                             # discovery cache can miss (see discovery.py)
+                                             discovery_cache=None if args.incremental or args.no_discovery_cache
+                                             else DEFAULT_CACHE_PATH)
+            with metrics.timer('create_tables'):
+                if args.incremental:
+                    program.create_tables()
+                else:
+                    program.recreate_tables()
+
+            # Invalidates cached part2 results before the data starts changing, and again
+            # once it is done, in case something read the half-loaded data in between
+            bump_dataset_version(program.db_connection, program.cursor)
+
+            dataset_path = args.dataset_path
+            with metrics.timer('populate_users'):
+                program.populate_user_table(dataset_path)
+            # Split further into walk, parse, insert and commit by the method itself
+            with metrics.timer('populate_activities_and_trackpoints'):
+                program.populate_activity_and_trackpoint_tables(dataset_path, workers=args.workers,
+                                                                incremental=args.incremental)
+            # Secondary indexes are only built once the bulk load is done
+            with metrics.timer('create_indexes'):
+                create_indexes(program.db_connection, program.cursor)
+            # Rollups for the part2 reports; an incremental load only touches the changed users
+            with metrics.timer('refresh_summaries'):
+                program.summaries.refresh(program.changed_users if args.incremental else None)
+
+            program.fetch_data("User")
+            program.fetch_data("Activity")
+            program.show_tables()
+
+            if args.label_update == 'sql':
+                with metrics.timer('label_update'):
+                    program.update_transportation_modes_sql(dataset_path)
+                with metrics.timer('label_verify'):
+                    program.verify_transportation_modes_sql(dataset_path)
+            else:
+                with metrics.timer('label_update'):
+                    program.update_transportation_modes(dataset_path)
+                with metrics.timer('label_verify'):
+                    program.verify_transportation_modes(dataset_path)
+
+            bump_dataset_version(program.db_connection, program.cursor)
         
     except Exception as e:
+        metrics.count('errors')
         print("ERROR: Failed to use database:", e)
     finally:
         if program:
             program.connection.close_connection()
+        metrics.print_summary()
+        if args.metrics:
+            metrics.write_json(args.metrics)
+            print(f"Metrics written to {args.metrics}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,133 @@
+import contextlib
+import cProfile
+import datetime
+import json
+import pstats
+import threading
+import time
+from tabulate import tabulate
+
+# Timers, counters and rate-limited warnings for main.py and part2.py. Instead of a
+# line per skipped file or malformed row, the first few warnings of each kind are
+# printed and the rest only counted. Everything is printed as a summary at the end
+# and can be written to a JSON file.
+
+
+class Metrics:
+    """
+    - timer(name) / add_time(name, seconds): total seconds and number of calls per stage
+    - count(name, amount): counters such as files, rows and skips
+    - warn(kind, message): prints the first warning_limit messages of each kind
+    - record_query(name, seconds, rows): latency and result size of a report query
+    Safe to use from several threads.
+    """
+
+    def __init__(self, warning_limit=10):
+        self.warning_limit = warning_limit
+        self.timers = {}
+        self.counters = {}
+        self.warnings = {}
+        self.queries = []
+        self.started_at = datetime.datetime.now()
+        self.lock = threading.Lock()
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            total, total_calls = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, total_calls + calls)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        # Charges the time spent producing each item to the timer, e.g. a directory walk.
+        # Calls counts the items.
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start, calls=0)
+                return
+            self.add_time(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def warn(self, kind, message):
+        with self.lock:
+            seen = self.warnings.get(kind, 0) + 1
+            self.warnings[kind] = seen
+        if seen <= self.warning_limit:
+            print(f"Warning: {message}")
+        if seen == self.warning_limit:
+            print(f"Warning: further '{kind}' warnings are counted but not printed.")
+
+    def record_query(self, name, seconds, rows):
+        with self.lock:
+            self.queries.append({'query': name, 'seconds': round(seconds, 6), 'rows': rows})
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'timers': {name: {'seconds': round(seconds, 6), 'calls': calls}
+                           for name, (seconds, calls) in self.timers.items()},
+                'counters': dict(self.counters),
+                'warnings': dict(self.warnings),
+                'queries': list(self.queries),
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def print_summary(self):
+        data = self.as_dict()
+        if data['timers']:
+            print(tabulate([(name, round(t['seconds'], 3), t['calls']) for name, t in data['timers'].items()],
+                           headers=['Stage', 'Seconds', 'Calls'], tablefmt='psql'))
+        counts = [(name, value) for name, value in data['counters'].items()]
+        counts += [(f"warnings: {kind}", value) for kind, value in data['warnings'].items()]
+        if counts:
+            print(tabulate(counts, headers=['Counter', 'Value'], tablefmt='psql'))
+        if data['queries']:
+            print(tabulate([(q['query'], round(q['seconds'], 3), q['rows']) for q in data['queries']],
+                           headers=['Query', 'Seconds', 'Rows'], tablefmt='psql'))
+
+
+def result_rows(result):
+    # Number of rows in a report query's return value
+    if result is None:
+        return 0
+    if isinstance(result, tuple):
+        return sum(result_rows(part) for part in result)
+    if isinstance(result, (list, dict, set)):
+        return len(result)
+    return 1
+
+
+@contextlib.contextmanager
+def profiled(path=None, top=25):
+    # Runs the block under cProfile if path is given, saves the stats there and
+    # prints the functions with the highest cumulative time
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
+        print(f"Profile written to {path}")
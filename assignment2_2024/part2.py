@@ -1,18 +1,113 @@
+import argparse
+import concurrent.futures
 import datetime
+import io
 import os
-from DbConnector import DbConnector
+import sys
+import threading
+import time
+from backends import BACKENDS, get_connector
 from tabulate import tabulate
-from haversine import haversine, Unit
+from distance_engine import DistanceEngine
+from metrics import Metrics, profiled, result_rows
+from query_cache import MISS, QueryCache, get_dataset_version
+from spatial import SpatialSearch
+from summaries import SUMMARY_TABLES
+from timeparse import year_range
 
 class ActivityTrackerProgram:
-    def __init__(self):
-        self.connection = DbConnector()
-        self.db_connection = self.connection.db_connection
-        self.cursor = self.connection.cursor
+    def __init__(self, use_summaries=True, cache=None, pool_size=None, connector=None, backend='mysql'):
+        if connector is None:
+            self.connection = get_connector(backend, pool_size=pool_size)
+            self.db_connection = self.connection.db_connection
+            self.cursor = self.connection.cursor
+        else:
+            # Shares the pool of another program, on a pooled connection of its own.
+            # Hand the connection back with release().
+            self.connection = connector
+            self.db_connection = connector.get_connection()
+            self.cursor = self.db_connection.cursor()
+        # Optional QueryCache for results, see query_cache.py. Only used once a
+        # loader has stamped the dataset with a version.
+        self.cache = cache
+        self.dataset_version = get_dataset_version(self.cursor) if cache else None
+        # Answer queries 1-6 and 11 from the rollup tables in summaries.py when
+        # they have been built, instead of aggregating Activity and TrackPoint
+        self.use_summaries = use_summaries and self.summaries_available()
+        # When set to a list, every query is also run with EXPLAIN ANALYZE and
+        # (query, plan) is appended to it. Used by index_benchmark.py.
+        self.plan_log = None
+
+    def release(self):
+        # Returns the connection of a program created with connector= to the pool
+        self.cursor.close()
+        self.db_connection.close()
+
+    def summaries_available(self):
+        if self.connection.dialect == 'sqlite':
+            self.cursor.execute("""SELECT COUNT(*)
+                                   FROM sqlite_master
+                                   WHERE type = 'table' AND name IN (%s, %s, %s)""",
+                                tuple(SUMMARY_TABLES))
+        else:
+            self.cursor.execute("""SELECT COUNT(*)
+                                   FROM information_schema.tables
+                                   WHERE table_schema = DATABASE() AND table_name IN (%s, %s, %s)""",
+                                tuple(SUMMARY_TABLES))
+        return self.cursor.fetchone()[0] == len(SUMMARY_TABLES)
+
+    def capture_plan(self, query, params=None):
+        if self.plan_log is None:
+            return
+        with self.connection.checkout() as (connection, cursor):
+            cursor.execute("EXPLAIN ANALYZE " + query, params)
+            # One text column in MySQL; SQLite's EXPLAIN QUERY PLAN has the text last
+            plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+        self.plan_log.append((query, plan))
+
+    def cached(self, query, params, compute):
+        # Returns compute()'s result for (query, params) from the cache if the dataset
+        # has not changed since it was stored. Bypassed while capturing plans.
+        if self.cache is None or self.dataset_version is None or self.plan_log is not None:
+            return compute()
+        key = self.cache.key(self.dataset_version, query, params)
+        result = self.cache.get(key)
+        if result is MISS:
+            result = compute()
+            self.cache.put(key, result)
+        return result
+
+    def execute_query(self, query, params=None):
+        def run():
+            self.capture_plan(query, params)
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        return self.cached(query, params, run)
 
-    def execute_query(self, query):
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+    def iter_query_chunks(self, query, params=None, chunk_size=10000):
+        # Streams the result set in lists of at most chunk_size rows instead of
+        # materializing it with fetchall(). Runs on an unbuffered cursor of its own
+        # pooled connection, so rows are read off the socket as they are consumed
+        # and self.cursor stays usable meanwhile.
+        self.capture_plan(query, params)
+        with self.connection.checkout(buffered=False) as (connection, cursor):
+            cursor.execute(query, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                # If the caller stopped early, the rest of the result still has to be
+                # read before the connection can be reused
+                while cursor.fetchmany(chunk_size):
+                    pass
+
+    def iter_query(self, query, params=None, chunk_size=10000):
+        # Row-by-row view of iter_query_chunks
+        for rows in self.iter_query_chunks(query, params, chunk_size):
+            yield from rows
 
     def print_query_results(self, results, headers):
         print(tabulate(results, headers=headers, tablefmt='psql'))
@@ -20,101 +115,164 @@ class ActivityTrackerProgram:
         
     #1. Dataset counts
     def count_dataset_elements(self):
-            query = """
-            SELECT
-                (SELECT COUNT(*) FROM User) as user_count,
-                (SELECT COUNT(*) FROM Activity) as activity_count,
-                (SELECT COUNT(*) FROM TrackPoint) as trackpoint_count
-            """
+            if self.use_summaries:
+                query = """
+                SELECT
+                    (SELECT COUNT(*) FROM User) as user_count,
+                    (SELECT CAST(COALESCE(SUM(activity_count), 0) AS SIGNED) FROM UserActivitySummary) as activity_count,
+                    (SELECT CAST(COALESCE(SUM(trackpoint_count), 0) AS SIGNED) FROM UserActivitySummary) as trackpoint_count
+                """
+            else:
+                query = """
+                SELECT
+                    (SELECT COUNT(*) FROM User) as user_count,
+                    (SELECT COUNT(*) FROM Activity) as activity_count,
+                    (SELECT COUNT(*) FROM TrackPoint) as trackpoint_count
+                """
             results = self.execute_query(query)
             headers = ['Users', 'Activities', 'Trackpoints']
             print("1. Dataset counts:")
             self.print_query_results(results, headers)
+            return results
             
     #2. Average number of activities per user        
     def average_activities_per_user(self):
-        query = """
-        SELECT AVG(activity_count) as avg_activities
-        FROM (
-            SELECT user_id, COUNT(*) as activity_count
-            FROM Activity
-            GROUP BY user_id
-        ) as user_activity_counts
-        """
+        if self.use_summaries:
+            query = """
+            SELECT AVG(activity_count) as avg_activities
+            FROM UserActivitySummary
+            WHERE activity_count > 0
+            """
+        else:
+            query = """
+            SELECT AVG(activity_count) as avg_activities
+            FROM (
+                SELECT user_id, COUNT(*) as activity_count
+                FROM Activity
+                GROUP BY user_id
+            ) as user_activity_counts
+            """
         results = self.execute_query(query)
         headers = ['Average Activities per User']
         print("2. Average number of activities per user:")
         self.print_query_results(results, headers)
+        return results
         
     # 3. Top 20 users with the highest number of activities
     def top_20_users_by_activity_count(self):
-        query = """
-        SELECT user_id, COUNT(*) as activity_count
-        FROM Activity
-        GROUP BY user_id
-        ORDER BY activity_count DESC
-        LIMIT 20
-        """
+        if self.use_summaries:
+            query = """
+            SELECT user_id, activity_count
+            FROM UserActivitySummary
+            WHERE activity_count > 0
+            ORDER BY activity_count DESC
+            LIMIT 20
+            """
+        else:
+            query = """
+            SELECT user_id, COUNT(*) as activity_count
+            FROM Activity
+            GROUP BY user_id
+            ORDER BY activity_count DESC
+            LIMIT 20
+            """
         results = self.execute_query(query)
         headers = ['User ID', 'Activity Count']
         print("3. Top 20 users with the highest number of activities:")
         self.print_query_results(results, headers)
+        return results
         
     # 4. Users who have taken a taxi
     def users_who_took_taxi(self):
-        query = """
-        SELECT DISTINCT user_id
-        FROM Activity
-        WHERE transportation_mode = 'taxi'
-        ORDER BY user_id
-        """
+        if self.use_summaries:
+            query = """
+            SELECT user_id
+            FROM UserModeSummary
+            WHERE transportation_mode = 'taxi'
+            ORDER BY user_id
+            """
+        else:
+            query = """
+            SELECT DISTINCT user_id
+            FROM Activity
+            WHERE transportation_mode = 'taxi'
+            ORDER BY user_id
+            """
         results = self.execute_query(query)
         headers = ['User ID']
         print("4. Users who have taken a taxi:")
         self.print_query_results(results, headers)
+        return results
         
     # 5. Count of activities for each transportation mode (excluding null)
     def count_transportation_modes(self):
-        query = """
-        SELECT transportation_mode, COUNT(*) as activity_count
-        FROM Activity
-        WHERE transportation_mode IS NOT NULL
-        GROUP BY transportation_mode
-        ORDER BY activity_count DESC
-        """
+        if self.use_summaries:
+            query = """
+            SELECT transportation_mode, CAST(SUM(activity_count) AS SIGNED) as activity_count
+            FROM UserModeSummary
+            GROUP BY transportation_mode
+            ORDER BY activity_count DESC
+            """
+        else:
+            query = """
+            SELECT transportation_mode, COUNT(*) as activity_count
+            FROM Activity
+            WHERE transportation_mode IS NOT NULL
+            GROUP BY transportation_mode
+            ORDER BY activity_count DESC
+            """
         results = self.execute_query(query)
         headers = ['Transportation Mode', 'Activity Count']
         print("5. Count of activities for each transportation mode (excluding null):")
         self.print_query_results(results, headers)
+        return results
         
     # 6. a) Year with the most activities
     def year_with_most_activities(self):
-        query = """
-        SELECT YEAR(start_date_time) as year, COUNT(*) as activity_count
-        FROM Activity
-        GROUP BY year
-        ORDER BY activity_count DESC
-        LIMIT 1
-        """
+        if self.use_summaries:
+            query = """
+            SELECT year, CAST(SUM(activity_count) AS SIGNED) as activity_count
+            FROM UserYearSummary
+            GROUP BY year
+            ORDER BY activity_count DESC
+            LIMIT 1
+            """
+        else:
+            query = """
+            SELECT YEAR(start_date_time) as year, COUNT(*) as activity_count
+            FROM Activity
+            GROUP BY year
+            ORDER BY activity_count DESC
+            LIMIT 1
+            """
         results = self.execute_query(query)
         return results
 
     # 6. b) Year with the most recorded hours
     def year_with_most_recorded_hours(self):
-        query = """
-        SELECT 
-            year, 
-            ROUND(SUM(duration_hours), 2) as total_hours
-        FROM (
+        if self.use_summaries:
+            query = """
+            SELECT year, ROUND(SUM(total_seconds) / 3600.0, 2) as total_hours
+            FROM UserYearSummary
+            GROUP BY year
+            ORDER BY total_hours DESC
+            LIMIT 1
+            """
+        else:
+            query = """
             SELECT 
-                YEAR(start_date_time) as year,
-                TIMESTAMPDIFF(SECOND, start_date_time, end_date_time) / 3600.0 as duration_hours
-            FROM Activity
-        ) as activity_durations
-        GROUP BY year
-        ORDER BY total_hours DESC
-        LIMIT 1
-        """
+                year, 
+                ROUND(SUM(duration_hours), 2) as total_hours
+            FROM (
+                SELECT 
+                    YEAR(start_date_time) as year,
+                    TIMESTAMPDIFF(SECOND, start_date_time, end_date_time) / 3600.0 as duration_hours
+                FROM Activity
+            ) as activity_durations
+            GROUP BY year
+            ORDER BY total_hours DESC
+            LIMIT 1
+            """
         results = self.execute_query(query)
         return results
 
@@ -144,61 +302,33 @@ class ActivityTrackerProgram:
         else:
             print(f"\nThe year with the most activities ({activities_year}) "
                 f"is different from the year with the most recorded hours ({hours_year}).")
+        return activities_results, hours_results
         
     # 7. Total distance walked in 2008 by user with id=112          
     def calculate_total_walking_distance_2008_user112(self):
-        query = """
-        SELECT a.id AS activity_id, t.lat, t.lon
-        FROM TrackPoint t
-        JOIN Activity a ON t.activity_id = a.id
-        WHERE a.user_id = '112'
-        AND YEAR(a.start_date_time) = 2008
-        AND a.transportation_mode = 'walk'
-        ORDER BY a.id, t.id
-        """
-        results = self.execute_query(query)
-        
-        total_distance = 0
-        current_activity = None
-        prev_point = None
-
-        for activity_id, lat, lon in results:
-            if activity_id != current_activity:
-                current_activity = activity_id
-                prev_point = None
-            
-            current_point = (lat, lon)
-            if prev_point:
-                distance = haversine(prev_point, current_point, unit=Unit.KILOMETERS)
-                total_distance += distance
-            
-            prev_point = current_point
+        # Trackpoints are streamed and summed per activity with vectorized haversine
+        engine = DistanceEngine(self)
+        # A range rather than YEAR(...) = 2008, so MySQL can prune partitions (see partitions.py)
+        start, end = year_range(2008)
+        where = "a.user_id = %s AND a.start_date_time >= %s AND a.start_date_time < %s AND a.transportation_mode = %s"
+        params = ('112', start, end, 'walk')
+        distances = self.cached('distance_engine.per_user ' + where, params,
+                                lambda: engine.per_user(where, params))
+        total_distance = distances.get('112', 0.0)
 
         print("\n7. Total distance walked in 2008 by user with id=112:")
         print(f"   {total_distance:.2f} km")
+        return total_distance
             
     # 8. Top 20 users who have gained the most altitude meters
     def top_20_users_by_altitude_gain(self):
+        # altitude_diff is precomputed per pair of consecutive trackpoints at ingest
+        # and is NULL when either altitude is missing (-777)
         query = """
-        WITH altitude_differences AS (
-            SELECT 
-                a.user_id,
-                t1.activity_id,
-                t1.altitude - t2.altitude AS altitude_diff_feet
-            FROM TrackPoint t1
-            JOIN TrackPoint t2 ON t1.activity_id = t2.activity_id AND t1.id = t2.id + 1
-            JOIN Activity a ON t1.activity_id = a.id
-            WHERE t1.altitude != -777 AND t2.altitude != -777
-        ),
-        user_altitude_gains AS (
-            SELECT 
-                user_id,
-                SUM(IF(altitude_diff_feet > 0, altitude_diff_feet, 0)) AS total_altitude_gain_feet
-            FROM altitude_differences
-            GROUP BY user_id
-        )
-        SELECT user_id, total_altitude_gain_feet
-        FROM user_altitude_gains
+        SELECT user_id, SUM(altitude_diff) AS total_altitude_gain_feet
+        FROM TrackPointSegment
+        WHERE altitude_diff > 0
+        GROUP BY user_id
         ORDER BY total_altitude_gain_feet DESC
         LIMIT 20
         """
@@ -217,28 +347,15 @@ class ActivityTrackerProgram:
         print()
         print("8. Top 20 users who have gained the most altitude meters:")
         self.print_query_results(converted_results, headers)
+        return converted_results
         
     # 9. Users with invalid activities and their count
     def find_users_with_invalid_activities(self):
+        # An activity is invalid if two consecutive trackpoints are 5 minutes or more apart
         query = """
-        WITH consecutive_points AS (
-            SELECT 
-                a.user_id,
-                t1.activity_id,
-                t1.date_time AS time1,
-                t2.date_time AS time2,
-                TIMESTAMPDIFF(SECOND, t1.date_time, t2.date_time) / 60 AS time_diff
-            FROM TrackPoint t1
-            JOIN TrackPoint t2 ON t1.activity_id = t2.activity_id AND t1.id = t2.id - 1
-            JOIN Activity a ON t1.activity_id = a.id
-        ),
-        invalid_activities AS (
-            SELECT DISTINCT user_id, activity_id
-            FROM consecutive_points
-            WHERE time_diff >= 5
-        )
         SELECT user_id, COUNT(DISTINCT activity_id) AS invalid_activity_count
-        FROM invalid_activities
+        FROM TrackPointSegment
+        WHERE time_diff_seconds >= 300
         GROUP BY user_id
         ORDER BY invalid_activity_count DESC
         """
@@ -246,29 +363,34 @@ class ActivityTrackerProgram:
         headers = ['User ID', 'Invalid Activity Count']
         print("\n9. Users with invalid activities and their count:")
         self.print_query_results(results, headers)
+        return results
 
     # 10. Users who have tracked an activity in the Forbidden City of Beijing
     def find_users_in_forbidden_city(self):
-        query = """
-        SELECT DISTINCT a.user_id
-        FROM Activity a
-        JOIN TrackPoint t ON a.id = t.activity_id
-        WHERE ROUND(t.lat,3) == 39.91 AND ROUND(t.lon, 3) = 116.397
-        ORDER BY a.user_id
-        """
-        results = self.execute_query(query)
+        # Trackpoints that round to (39.916, 116.397) at three decimals, looked up as a
+        # bounding box on the spatial index instead of rounding every row. The original
+        # query compared ROUND(lat, 3) to 39.91, a typo for the Forbidden City's 39.916.
+        user_ids = SpatialSearch(self).users_in_bbox(39.9155, 116.3965, 39.9165, 116.3975)
+        results = [(user_id,) for user_id in user_ids]
         headers = ['User ID']
         print("\n10. Users who have tracked an activity in the Forbidden City of Beijing:")
         self.print_query_results(results, headers)
+        return results
       
     # 11. Users with registered transportation_mode and their most used mode  
     def find_users_most_used_transportation(self):
-        query = """
-        SELECT user_id, transportation_mode, COUNT(*) as mode_count
-        FROM Activity
-        WHERE transportation_mode IS NOT NULL
-        GROUP BY user_id, transportation_mode
-        """
+        if self.use_summaries:
+            query = """
+            SELECT user_id, transportation_mode, activity_count as mode_count
+            FROM UserModeSummary
+            """
+        else:
+            query = """
+            SELECT user_id, transportation_mode, COUNT(*) as mode_count
+            FROM Activity
+            WHERE transportation_mode IS NOT NULL
+            GROUP BY user_id, transportation_mode
+            """
         results = self.execute_query(query)
         
         user_modes = {}
@@ -285,31 +407,148 @@ class ActivityTrackerProgram:
         headers = ['User ID', 'Most Used Transportation Mode']
         print("\n11. Users with registered transportation_mode and their most used mode:")
         self.print_query_results(most_used_modes, headers)
+        return most_used_modes
+
+
+class ThreadLocalStdout:
+    """
+    Stand-in for sys.stdout that sends writes from a thread to that thread's buffer,
+    if it has set one, so concurrently running queries can print without interleaving.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def write(self, text):
+        return (getattr(self.local, 'buffer', None) or self.default).write(text)
+
+    def flush(self):
+        (getattr(self.local, 'buffer', None) or self.default).flush()
+
+
+def run_report(program, queries, parallelism=1, metrics=None):
+    # Runs the (number, method name) queries and prints their output in the given order.
+    # With parallelism > 1 they run on that many threads, each on its own pooled
+    # connection, and each query's output is buffered until the ones before it are printed.
+    # Latency and rows returned of each query are recorded in metrics, in report order.
+    # Returns [(number, seconds), ...].
+    metrics = metrics or Metrics()
+    if parallelism <= 1:
+        timings = []
+        for number, method_name in queries:
+            start = time.perf_counter()
+            result = getattr(program, method_name)()
+            elapsed = time.perf_counter() - start
+            metrics.record_query(number, elapsed, result_rows(result))
+            timings.append((number, elapsed))
+        return timings
+
+    stdout = ThreadLocalStdout(sys.stdout)
+
+    def run_query(method_name):
+        stdout.local.buffer = io.StringIO()
+        worker = ActivityTrackerProgram(use_summaries=program.use_summaries, cache=program.cache,
+                                        connector=program.connection)
+        try:
+            start = time.perf_counter()
+            result = getattr(worker, method_name)()
+            return stdout.local.buffer.getvalue(), time.perf_counter() - start, result_rows(result)
+        finally:
+            worker.release()
+            stdout.local.buffer = None
+
+    timings = []
+    sys.stdout = stdout
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+            futures = [(number, executor.submit(run_query, method_name)) for number, method_name in queries]
+            for number, future in futures:
+                output, elapsed, rows = future.result()
+                stdout.default.write(output)
+                metrics.record_query(number, elapsed, rows)
+                timings.append((number, elapsed))
+    finally:
+        sys.stdout = stdout.default
+    return timings
+
+
+# The report, in order: (query number, ActivityTrackerProgram method name)
+REPORT_QUERIES = [
+    ('1', 'count_dataset_elements'),
+    ('2', 'average_activities_per_user'),
+    ('3', 'top_20_users_by_activity_count'),
+    ('4', 'users_who_took_taxi'),
+    ('5', 'count_transportation_modes'),
+    ('6', 'compare_most_activities_and_hours'),
+    ('7', 'calculate_total_walking_distance_2008_user112'),
+    ('8', 'top_20_users_by_altitude_gain'),
+    ('9', 'find_users_with_invalid_activities'),
+    ('10', 'find_users_in_forbidden_city'),
+    ('11', 'find_users_most_used_transportation'),
+]
 
         
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the part 2 queries against the GeoLife database.")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql',
+                        help="Query the MySQL server or the SQLite file written by main.py --backend sqlite (default: mysql)")
+    parser.add_argument('--no-summaries', action='store_true',
+                        help="Aggregate the raw Activity/TrackPoint tables instead of the summary tables")
+    parser.add_argument('--no-cache', action='store_true', help="Always run the queries against the database")
+    parser.add_argument('--cache-dir', default='.query_cache', help="Where cached results are kept (default: .query_cache)")
+    parser.add_argument('--cache-size', type=int, default=256, help="Maximum number of cached results (default: 256)")
+    parser.add_argument('--parallel', type=int, default=1,
+                        help="Number of queries run at the same time, each on its own connection (default: 1)")
+    parser.add_argument('--queries', nargs='+', choices=[number for number, _ in REPORT_QUERIES],
+                        help="Only run these query numbers (default: all)")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="Write the latency and rows returned of each query to this JSON file")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Run under cProfile and save the stats to this file (main thread only)")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    metrics = Metrics()
     program = None
     try:
-        program = ActivityTrackerProgram()
+        cache = None if args.no_cache else QueryCache(args.cache_dir, args.cache_size)
+        # Each running query may hold a second connection while streaming (query 7)
+        pool_size = min(2 * args.parallel + 1, 32) if args.parallel > 1 else None
+        program = ActivityTrackerProgram(use_summaries=not args.no_summaries, cache=cache, pool_size=pool_size,
+                                         backend=args.backend)
         
         #Execute queries
-        program.count_dataset_elements()
-        program.average_activities_per_user()
-        program.top_20_users_by_activity_count()
-        program.users_who_took_taxi()
-        program.count_transportation_modes()
-        program.compare_most_activities_and_hours()
-        program.calculate_total_walking_distance_2008_user112()
-        program.top_20_users_by_altitude_gain()
-        program.find_users_with_invalid_activities()
-        program.find_users_in_forbidden_city()
-        program.find_users_most_used_transportation()
+        queries = [(number, method_name) for number, method_name in REPORT_QUERIES
+                   if not args.queries or number in args.queries]
+        start = time.perf_counter()
+        with profiled(args.profile):
+            timings = run_report(program, queries, parallelism=args.parallel, metrics=metrics)
+        wall_clock = time.perf_counter() - start
+        metrics.add_time('report', wall_clock)
+
+        print("Query timings:")
+        metrics.print_summary()
+        print(f"Total wall-clock time: {wall_clock:.3f}s "
+              f"(sum of query times: {sum(seconds for _, seconds in timings):.3f}s, parallelism: {args.parallel})")
+
+        if cache:
+            stats = cache.stats()
+            print(f"Query cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries")
+            metrics.count('cache_hits', stats['hits'])
+            metrics.count('cache_misses', stats['misses'])
         
     except Exception as e:
         print("An error occurred:", e)
     finally:
         if program:
             program.connection.close_connection()
+        if args.metrics:
+            metrics.write_json(args.metrics)
+            print(f"Metrics written to {args.metrics}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+from backends import dialect_of
+from tabulate import tabulate
+
+# Range partitioning of Activity and TrackPoint by month (main.py --partition, MySQL
+# only). Each table is split on its own timestamp: Activity on start_date_time,
+# TrackPoint on date_time. Partition pYYYYMM holds one month (the first one also
+# everything older) and p_future everything after the last month. Filters written
+# as ranges on these columns, not as YEAR(...) = ..., let MySQL skip the other months.
+#
+# MySQL does not allow foreign keys or spatial columns in partitioned tables, and
+# every unique key must contain the partitioning column. Partitioned tables
+# therefore have no foreign keys, Activity's primary key is (id, start_date_time),
+# TrackPoint's includes date_time, and TrackPoint has no location column: spatial.py
+# compares lat/lon instead, as on SQLite.
+
+PARTITION_COLUMNS = {'Activity': 'start_date_time', 'TrackPoint': 'date_time'}
+
+# The GeoLife recordings span April 2007 to August 2012
+FIRST_MONTH = (2007, 1)
+LAST_MONTH = (2012, 12)
+
+
+def parse_month(text):
+    # "YYYY-MM" -> (year, month)
+    try:
+        date = datetime.datetime.strptime(text, '%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {text!r}")
+    return date.year, date.month
+
+
+def next_month(month):
+    year, month = month
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_range(first, last):
+    month = first
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def partition_name(month):
+    return f"p{month[0]}{month[1]:02d}"
+
+
+def month_partition(month):
+    year, month_number = next_month(month)
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{year}-{month_number:02d}-01')"
+
+
+def partition_clause(column, first=FIRST_MONTH, last=LAST_MONTH):
+    # Appended to CREATE TABLE
+    partitions = [month_partition(month) for month in month_range(first, last)]
+    partitions.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+    return f"PARTITION BY RANGE COLUMNS({column}) ({', '.join(partitions)})"
+
+
+def list_partitions(cursor):
+    # [(table, partition, upper bound, rows)]; rows are InnoDB estimates
+    if dialect_of(cursor) != 'mysql':
+        return []
+    cursor.execute("""SELECT table_name, partition_name, partition_description, table_rows
+                      FROM information_schema.partitions
+                      WHERE table_schema = DATABASE() AND partition_name IS NOT NULL
+                      ORDER BY table_name, partition_ordinal_position""")
+    return cursor.fetchall()
+
+
+def is_partitioned(cursor, table):
+    return any(name.lower() == table.lower() for name, _, _, _ in list_partitions(cursor))
+
+
+def month_partitions(cursor, table):
+    # Months of the pYYYYMM partitions of table, in order
+    return [(int(partition[1:5]), int(partition[5:7]))
+            for name, partition, _, _ in list_partitions(cursor)
+            if name.lower() == table.lower() and partition != 'p_future']
+
+
+def add_partitions(cursor, until):
+    # Splits p_future into monthly partitions up to and including until
+    for table in PARTITION_COLUMNS:
+        months = month_partitions(cursor, table)
+        if not months:
+            print(f"{table} is not partitioned.")
+            continue
+        new_months = list(month_range(next_month(months[-1]), until))
+        if not new_months:
+            print(f"{table} already has partitions up to {partition_name(months[-1])}.")
+            continue
+        partitions = [month_partition(month) for month in new_months]
+        partitions.append("PARTITION p_future VALUES LESS THAN (MAXVALUE)")
+        # Rows already in p_future are moved into the new months
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION p_future INTO ({', '.join(partitions)})")
+        print(f"Added {len(new_months)} partitions to {table}, up to {partition_name(new_months[-1])}.")
+
+
+def drop_partitions(db_connection, cursor, before):
+    # Drops the months before `before` from both tables, which deletes their rows far
+    # faster than DELETE. Returns the users whose activities were dropped.
+    from query_cache import bump_dataset_version
+    from summaries import SummaryTables
+
+    cutoff = datetime.datetime(before[0], before[1], 1)
+    plans = {}
+    for table in PARTITION_COLUMNS:
+        months = month_partitions(cursor, table)
+        dropped = [month for month in months if month < before]
+        if dropped and len(dropped) == len(months):
+            raise ValueError(f"Dropping everything before {before[0]}-{before[1]:02d} would leave "
+                             f"{table} without monthly partitions")
+        plans[table] = dropped
+
+    # A trackpoint recorded out of time order can be dated before the cutoff while its
+    # activity starts after it. Dropping its partition would delete it from an activity
+    # that is kept, leaving its segments and manifest row count behind.
+    cursor.execute("""SELECT COUNT(*) FROM TrackPoint t JOIN Activity a ON t.activity_id = a.id
+                      WHERE t.date_time < %s AND a.start_date_time >= %s""", (cutoff, cutoff))
+    strays = cursor.fetchone()[0]
+    if strays:
+        raise ValueError(f"{strays} trackpoints before {before[0]}-{before[1]:02d} belong to activities that "
+                         f"start later; choose an earlier cutoff")
+
+    cursor.execute("SELECT DISTINCT user_id FROM Activity WHERE start_date_time < %s", (cutoff,))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    try:
+        # Rows of the dropped activities that live outside the dropped partitions.
+        # Trackpoints are recorded after their activity's start, but may run past the cutoff.
+        cursor.execute("""DELETE t FROM TrackPoint t JOIN Activity a ON t.activity_id = a.id
+                          WHERE a.start_date_time < %s AND t.date_time >= %s""", (cutoff, cutoff))
+        cursor.execute("""DELETE s FROM TrackPointSegment s JOIN Activity a ON s.activity_id = a.id
+                          WHERE a.start_date_time < %s""", (cutoff,))
+        # Kept as skipped files, so incremental loads do not bring the activities back
+        cursor.execute("""UPDATE IngestManifest m JOIN Activity a ON m.activity_id = a.id
+                          SET m.activity_id = NULL, m.row_count = 0
+                          WHERE a.start_date_time < %s""", (cutoff,))
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+
+    for table, months in plans.items():
+        if months:
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(map(partition_name, months))}")
+            print(f"Dropped {len(months)} partitions from {table}.")
+    SummaryTables(db_connection, cursor).refresh(user_ids)
+    bump_dataset_version(db_connection, cursor)
+    return user_ids
+
+
+def main():
+    from DbConnector import DbConnector
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of Activity and TrackPoint.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Show the partitions and their estimated row counts")
+    add_parser = subparsers.add_parser('add', help="Add monthly partitions for new data")
+    add_parser.add_argument('--until', type=parse_month, required=True, metavar='YYYY-MM',
+                            help="Last month to add a partition for")
+    drop_parser = subparsers.add_parser('drop', help="Drop old months together with their activities")
+    drop_parser.add_argument('--before', type=parse_month, required=True, metavar='YYYY-MM',
+                             help="Drop every month before this one")
+    args = parser.parse_args()
+
+    connection = None
+    try:
+        connection = DbConnector()
+        if args.command == 'add':
+            add_partitions(connection.cursor, args.until)
+        elif args.command == 'drop':
+            user_ids = drop_partitions(connection.db_connection, connection.cursor, args.before)
+            print(f"Removed activities of {len(user_ids)} users.")
+        print(tabulate(list_partitions(connection.cursor), headers=['Table', 'Partition', 'Less Than', 'Rows'],
+                       tablefmt='psql'))
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        if connection:
+            connection.close_connection()
+
+if __name__ == '__main__':
+    main()
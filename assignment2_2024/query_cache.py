@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+import threading
+import uuid
+from backends import dialect_of
+
+# Disk cache for query results. Entries are keyed on the dataset version, the
+# normalized SQL and its parameters. main.py writes a new random version to the
+# DatasetVersion table whenever it changes data, so entries from before a load
+# can never be hit again. They just age out of the LRU.
+
+MISS = object()
+
+
+def ensure_version_table(db_connection, cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS DatasetVersion (
+                      id TINYINT NOT NULL PRIMARY KEY,
+                      version CHAR(32) NOT NULL,
+                      updated_at DATETIME NOT NULL)
+                   """)
+    db_connection.commit()
+
+
+def bump_dataset_version(db_connection, cursor):
+    # A random stamp rather than a counter, so it stays unique even if the table is recreated
+    ensure_version_table(db_connection, cursor)
+    version = uuid.uuid4().hex
+    cursor.execute("""INSERT INTO DatasetVersion (id, version, updated_at) VALUES (1, %s, NOW())
+                      ON DUPLICATE KEY UPDATE version = VALUES(version), updated_at = VALUES(updated_at)""",
+                   (version,))
+    db_connection.commit()
+    return version
+
+
+def get_dataset_version(cursor):
+    # None if no loader has stamped the database yet
+    if dialect_of(cursor) == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'DatasetVersion'")
+    else:
+        cursor.execute("""SELECT COUNT(*) FROM information_schema.tables
+                          WHERE table_schema = DATABASE() AND table_name = 'DatasetVersion'""")
+    if not cursor.fetchone()[0]:
+        return None
+    cursor.execute("SELECT version FROM DatasetVersion WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class QueryCache:
+    """
+    Pickled query results in a directory, one file per entry, evicted least recently
+    used first once there are more than max_entries. File mtimes record recency.
+    """
+
+    def __init__(self, directory='.query_cache', max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # The counters are shared by concurrently running queries
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, version, query, params=None):
+        normalized = ' '.join(query.split())
+        return hashlib.sha256(repr((version, normalized, params)).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self.lock:
+                self.misses += 1
+            return MISS
+        try:
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            pass  # Evicted by another query in the meantime
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        # Written to a temporary file first, so readers never see half an entry
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pkl')]
+
+    def evict(self):
+        entries = self.entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for entry in self.entries():
+            os.remove(entry.path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries()),
+        }
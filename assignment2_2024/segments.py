@@ -0,0 +1,27 @@
+from haversine import haversine, Unit
+
+# Derived rows for each pair of consecutive trackpoints in an activity, stored in
+# the TrackPointSegment table. seq is the position of the pair's first point in
+# the .plt file, so segments follow the recorded order rather than the
+# AUTO_INCREMENT ids of TrackPoint.
+SEGMENT_COLUMNS = ('activity_id', 'seq', 'user_id', 'altitude_diff', 'time_diff_seconds', 'distance_km')
+
+# GeoLife marks a missing altitude with -777
+INVALID_ALTITUDE = -777
+
+
+def compute_segments(activity_id, user_id, trackpoints):
+    # trackpoints are (activity_id, lat, lon, altitude, date_days, date_time) tuples in file order.
+    # altitude_diff is None when either altitude is missing.
+    segments = []
+    for seq in range(len(trackpoints) - 1):
+        _, lat1, lon1, altitude1, _, time1 = trackpoints[seq]
+        _, lat2, lon2, altitude2, _, time2 = trackpoints[seq + 1]
+        if altitude1 == INVALID_ALTITUDE or altitude2 == INVALID_ALTITUDE:
+            altitude_diff = None
+        else:
+            altitude_diff = altitude2 - altitude1
+        time_diff_seconds = int((time2 - time1).total_seconds())
+        distance_km = haversine((lat1, lon1), (lat2, lon2), unit=Unit.KILOMETERS)
+        segments.append((activity_id, seq, user_id, altitude_diff, time_diff_seconds, distance_km))
+    return segments
@@ -0,0 +1,76 @@
+import math
+from partitions import is_partitioned
+
+# Place-based lookups over TrackPoint.location, a generated POINT(lon, lat) column
+# with a SPATIAL INDEX (see indexes.py). Bounding boxes are answered with MBRContains,
+# which MySQL resolves as an R-tree range scan. Radius searches use the bounding box
+# of the circle for the index scan and ST_Distance_Sphere for the exact cut.
+# On the SQLite backend, which has no geometry types, the same searches compare
+# lat/lon directly and use distance_sphere_m from sqlite_backend.py. So do they on a
+# partitioned TrackPoint table, which MySQL does not allow spatial columns in
+# (see partitions.py), with ST_Distance_Sphere on POINT(lon, lat) built per row.
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def bounding_box(lat, lon, radius_km):
+    # (min_lat, min_lon, max_lat, max_lon) of the circle around (lat, lon)
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def box_wkt(min_lat, min_lon, max_lat, max_lon):
+    # Axis order matches location: x is longitude, y is latitude
+    return (f"POLYGON(({min_lon} {min_lat}, {max_lon} {min_lat}, {max_lon} {max_lat}, "
+            f"{min_lon} {max_lat}, {min_lon} {min_lat}))")
+
+
+class SpatialSearch:
+    """
+    Users and activities with trackpoints inside a bounding box or within a radius of a point.
+    Runs its queries through part2.ActivityTrackerProgram.execute_query.
+    """
+
+    def __init__(self, program):
+        self.program = program
+
+    def _query(self, select, box, radius=None):
+        # box is (min_lat, min_lon, max_lat, max_lon); radius is (lat, lon, km)
+        mysql = self.program.connection.dialect == 'mysql'
+        if mysql and not is_partitioned(self.program.cursor, 'TrackPoint'):
+            where = "MBRContains(ST_GeomFromText(%s), t.location)"
+            params = (box_wkt(*box),)
+            if radius:
+                where += " AND ST_Distance_Sphere(t.location, POINT(%s, %s)) <= %s"
+                params += (radius[1], radius[0], radius[2] * 1000)
+        else:
+            # Strictly inside, like MBRContains
+            where = "t.lat > %s AND t.lat < %s AND t.lon > %s AND t.lon < %s"
+            params = (box[0], box[2], box[1], box[3])
+            if radius and mysql:
+                where += " AND ST_Distance_Sphere(POINT(t.lon, t.lat), POINT(%s, %s)) <= %s"
+                params += (radius[1], radius[0], radius[2] * 1000)
+            elif radius:
+                where += " AND distance_sphere_m(t.lat, t.lon, %s, %s) <= %s"
+                params += (radius[0], radius[1], radius[2] * 1000)
+        query = f"""
+        SELECT DISTINCT {select}
+        FROM TrackPoint t
+        JOIN Activity a ON a.id = t.activity_id
+        WHERE {where}
+        ORDER BY {select}
+        """
+        return [row[0] for row in self.program.execute_query(query, params)]
+
+    def activities_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return self._query('a.id', (min_lat, min_lon, max_lat, max_lon))
+
+    def users_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return self._query('a.user_id', (min_lat, min_lon, max_lat, max_lon))
+
+    def activities_within_radius(self, lat, lon, radius_km):
+        return self._query('a.id', bounding_box(lat, lon, radius_km), (lat, lon, radius_km))
+
+    def users_within_radius(self, lat, lon, radius_km):
+        return self._query('a.user_id', bounding_box(lat, lon, radius_km), (lat, lon, radius_km))
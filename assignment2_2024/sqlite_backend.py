@@ -0,0 +1,229 @@
+import datetime
+import decimal
+import functools
+import math
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+# Embedded SQLite backend with the same interface as DbConnector. The rest of the
+# code keeps writing MySQL; SqliteCursor translates each statement to SQLite
+# before running it:
+#   %s placeholders             -> ?
+#   YEAR(x)                     -> CAST(strftime('%Y', x) AS INTEGER)
+#   TIMESTAMPDIFF(SECOND, a, b) -> difference of strftime('%s') values
+#   IF(c, a, b)                 -> IIF(c, a, b)
+#   CAST(x AS SIGNED)           -> CAST(x AS INTEGER)
+#   NOW()                       -> CURRENT_TIMESTAMP
+#   INSERT IGNORE               -> INSERT OR IGNORE
+#   ON DUPLICATE KEY UPDATE c = VALUES(c) -> ON CONFLICT DO UPDATE SET c = excluded.c
+#   ALTER TABLE t ADD INDEX / DROP INDEX  -> CREATE INDEX / DROP INDEX
+#   TRUNCATE TABLE, SHOW TABLES, EXPLAIN ANALYZE, INT AUTO_INCREMENT
+# Statements MySQL and SQLite cannot share (UPDATE ... JOIN, information_schema,
+# spatial columns) are chosen by the callers based on connector.dialect.
+# DATETIME columns are stored as 'YYYY-MM-DD HH:MM:SS' text and read back as datetimes.
+
+# Earth radius used by MySQL's ST_Distance_Sphere, in meters
+SPHERE_RADIUS_M = 6370986
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter('DATETIME', lambda value: datetime.datetime.fromisoformat(value.decode()))
+
+SIMPLE_REWRITES = [
+    (re.compile(r'\bEXPLAIN ANALYZE\b', re.I), 'EXPLAIN QUERY PLAN'),
+    (re.compile(r'\bSHOW TABLES\b', re.I), "SELECT name AS Tables FROM sqlite_master WHERE type = 'table' ORDER BY name"),
+    (re.compile(r'\bTRUNCATE TABLE (\w+)', re.I), r'DELETE FROM \1'),
+    (re.compile(r'\bINSERT IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r'\bNOW\(\)', re.I), 'CURRENT_TIMESTAMP'),
+    (re.compile(r'\bAS SIGNED\b', re.I), 'AS INTEGER'),
+    (re.compile(r'\bIF\s*\(', re.I), 'IIF('),
+    (re.compile(r'\bINT AUTO_INCREMENT NOT NULL PRIMARY KEY\b', re.I), 'INTEGER NOT NULL PRIMARY KEY'),
+    (re.compile(r'\bALTER TABLE (\w+) ADD (?:INDEX|KEY) (\w+) ', re.I), r'CREATE INDEX IF NOT EXISTS \2 ON \1 '),
+    (re.compile(r'\bALTER TABLE (\w+) DROP INDEX (\w+)', re.I), r'DROP INDEX IF EXISTS \2'),
+]
+DUPLICATE_KEY_UPDATE = re.compile(r'\bON DUPLICATE KEY UPDATE\b(.*)$', re.I | re.S)
+VALUES_REFERENCE = re.compile(r'\bVALUES\((\w+)\)', re.I)
+
+
+def _split_arguments(text, start):
+    # Returns the top-level comma-separated arguments of the call whose opening
+    # parenthesis is at text[start], and the index just past its closing parenthesis
+    depth = 0
+    arguments = []
+    current = start + 1
+    for i in range(start, len(text)):
+        if text[i] == '(':
+            depth += 1
+        elif text[i] == ')':
+            depth -= 1
+            if depth == 0:
+                arguments.append(text[current:i].strip())
+                return arguments, i + 1
+        elif text[i] == ',' and depth == 1:
+            arguments.append(text[current:i].strip())
+            current = i + 1
+    raise ValueError(f"Unbalanced parentheses in: {text}")
+
+
+def _rewrite_calls(query, name, rewrite):
+    pattern = re.compile(rf'\b{name}\s*\(', re.I)
+    while True:
+        match = pattern.search(query)
+        if not match:
+            return query
+        arguments, end = _split_arguments(query, match.end() - 1)
+        query = query[:match.start()] + rewrite(*arguments) + query[end:]
+
+
+def _epoch(expression):
+    return f"CAST(strftime('%s', {expression}) AS INTEGER)"
+
+
+def _timestampdiff(unit, start, end):
+    if unit.upper() != 'SECOND':
+        raise ValueError(f"TIMESTAMPDIFF unit {unit} is not supported by the SQLite backend")
+    return f"({_epoch(end)} - {_epoch(start)})"
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(query):
+    # MySQL statement -> SQLite statement, see the table at the top of the file
+    query = query.replace('%s', '?')
+    for pattern, replacement in SIMPLE_REWRITES:
+        query = pattern.sub(replacement, query)
+    query = DUPLICATE_KEY_UPDATE.sub(
+        lambda match: 'ON CONFLICT DO UPDATE SET' + VALUES_REFERENCE.sub(r'excluded.\1', match.group(1)), query)
+    query = _rewrite_calls(query, 'YEAR', lambda value: f"CAST(strftime('%Y', {value}) AS INTEGER)")
+    query = _rewrite_calls(query, 'TIMESTAMPDIFF', _timestampdiff)
+    return query
+
+
+def distance_sphere_m(lat1, lon1, lat2, lon2):
+    # Same as MySQL's ST_Distance_Sphere, registered as a function on every connection
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * SPHERE_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class SqliteCursor:
+    """
+    sqlite3 cursor that takes MySQL statements, with the parts of the
+    mysql.connector cursor interface the programs use (column_names).
+    """
+    dialect = 'sqlite'
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, query, params=None):
+        self.cursor.execute(translate(query), tuple(params) if params else ())
+
+    def executemany(self, query, params):
+        self.cursor.executemany(translate(query), params)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self.cursor.description or ())
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection:
+    dialect = 'sqlite'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self, **cursor_kwargs):
+        # mysql.connector options such as buffered do not apply
+        return SqliteCursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+    def get_server_info(self):
+        return f"SQLite {sqlite3.sqlite_version}"
+
+
+class SqliteConnector:
+    """
+    Opens the SQLite database file at path (SQLITE_PATH, default geolife.sqlite).
+    Same interface as DbConnector: db_connection and cursor for the lifetime of the
+    connector, get_connection() and checkout() for more. There is no pool; every
+    connection is a new handle on the file. With WAL, readers on other connections
+    see the last commit and do not block the writer.
+
+    synchronous (SQLITE_SYNCHRONOUS, default NORMAL) can be set to OFF for faster bulk
+    loads, at the risk of a corrupt file if the machine (not the process) crashes.
+    pool_size is accepted for compatibility and ignored.
+    """
+    dialect = 'sqlite'
+
+    def __init__(self, path=None, synchronous=None, cache_mb=256, pool_size=None):
+        self.path = path or os.environ.get('SQLITE_PATH', 'geolife.sqlite')
+        self.database = self.path
+        self.synchronous = synchronous or os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+        self.cache_mb = cache_mb
+
+        self.db_connection = self.get_connection()
+        self.cursor = self.db_connection.cursor()
+        # WAL is a property of the file, so setting it once is enough
+        self.db_connection.connection.execute("PRAGMA journal_mode = WAL")
+
+        print("Connected to:", self.db_connection.get_server_info())
+        print("You are connected to the database:", self.path)
+        print("-----------------------------------------------\n")
+
+    def get_connection(self):
+        connection = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        connection.execute(f"PRAGMA cache_size = -{self.cache_mb * 1024}")
+        connection.execute(f"PRAGMA mmap_size = {self.cache_mb * 1024 * 1024}")
+        connection.create_function('distance_sphere_m', 4, distance_sphere_m, deterministic=True)
+        return SqliteConnection(connection)
+
+    @contextmanager
+    def checkout(self, **cursor_kwargs):
+        connection = self.get_connection()
+        cursor = connection.cursor(**cursor_kwargs)
+        try:
+            yield connection, cursor
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def close_connection(self):
+        server_info = self.db_connection.get_server_info()
+        self.cursor.close()
+        self.db_connection.close()
+        print("\n-----------------------------------------------")
+        print("Connection to %s is closed" % server_info)
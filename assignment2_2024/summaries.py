@@ -0,0 +1,82 @@
+SUMMARY_TABLES = ['UserActivitySummary', 'UserModeSummary', 'UserYearSummary']
+
+
+class SummaryTables:
+    """
+    Rollup tables behind part2 queries 1-6 and 11, kept per user so that a change to
+    one user's activities or labels only recomputes that user's rows:
+    - UserActivitySummary: activities and trackpoints per user
+    - UserModeSummary: activities per user and transportation mode
+    - UserYearSummary: activities and recorded seconds per user and start year
+    Trackpoint counts come from the row counts in IngestManifest, so a refresh
+    reads Activity-sized tables only, never TrackPoint.
+    """
+
+    def __init__(self, db_connection, cursor):
+        self.db_connection = db_connection
+        self.cursor = cursor
+
+    def create_tables(self):
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS UserActivitySummary (
+                               user_id VARCHAR(255) NOT NULL PRIMARY KEY,
+                               activity_count INT NOT NULL,
+                               trackpoint_count BIGINT NOT NULL)
+                            """)
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS UserModeSummary (
+                               user_id VARCHAR(255) NOT NULL,
+                               transportation_mode VARCHAR(255) NOT NULL,
+                               activity_count INT NOT NULL,
+                               PRIMARY KEY (user_id, transportation_mode))
+                            """)
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS UserYearSummary (
+                               user_id VARCHAR(255) NOT NULL,
+                               year INT NOT NULL,
+                               activity_count INT NOT NULL,
+                               total_seconds BIGINT NOT NULL,
+                               PRIMARY KEY (user_id, year))
+                            """)
+        self.db_connection.commit()
+
+    def drop_tables(self):
+        for table in SUMMARY_TABLES:
+            self.cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        self.db_connection.commit()
+
+    def refresh(self, user_ids=None):
+        # Recomputes the rows of the given users, or of everyone if user_ids is None,
+        # in one transaction
+        if user_ids is not None:
+            user_ids = sorted(set(user_ids))
+            if not user_ids:
+                return
+            placeholders = ', '.join(['%s'] * len(user_ids))
+            delete_filter = f"WHERE user_id IN ({placeholders})"
+            activity_filter = f"AND a.user_id IN ({placeholders})"
+            params = tuple(user_ids)
+        else:
+            delete_filter, activity_filter, params = '', '', ()
+
+        try:
+            for table in SUMMARY_TABLES:
+                self.cursor.execute(f"DELETE FROM {table} {delete_filter}", params)
+            self.cursor.execute(f"""INSERT INTO UserActivitySummary (user_id, activity_count, trackpoint_count)
+                                    SELECT a.user_id, COUNT(*), COALESCE(SUM(m.row_count), 0)
+                                    FROM Activity a
+                                    LEFT JOIN IngestManifest m ON m.activity_id = a.id
+                                    WHERE a.user_id IS NOT NULL {activity_filter}
+                                    GROUP BY a.user_id""", params)
+            self.cursor.execute(f"""INSERT INTO UserModeSummary (user_id, transportation_mode, activity_count)
+                                    SELECT a.user_id, a.transportation_mode, COUNT(*)
+                                    FROM Activity a
+                                    WHERE a.user_id IS NOT NULL AND a.transportation_mode IS NOT NULL {activity_filter}
+                                    GROUP BY a.user_id, a.transportation_mode""", params)
+            self.cursor.execute(f"""INSERT INTO UserYearSummary (user_id, year, activity_count, total_seconds)
+                                    SELECT a.user_id, YEAR(a.start_date_time), COUNT(*),
+                                           SUM(TIMESTAMPDIFF(SECOND, a.start_date_time, a.end_date_time))
+                                    FROM Activity a
+                                    WHERE a.user_id IS NOT NULL {activity_filter}
+                                    GROUP BY a.user_id, YEAR(a.start_date_time)""", params)
+            self.db_connection.commit()
+        except Exception:
+            self.db_connection.rollback()
+            raise
@@ -0,0 +1,108 @@
+import argparse
+import datetime
+import os
+import random
+
+# Writes a GeoLife-shaped dataset for benchmarking without the real download:
+#   <output>/dataset/Data/<user>/Trajectory/<start>.plt
+#   <output>/dataset/Data/<user>/labels.txt   (labeled users only)
+#   <output>/dataset/labeled_ids.txt
+# Trajectories are random walks around Beijing with a point every few seconds.
+# The same seed always produces the same files.
+
+TRANSPORTATION_MODES = ['walk', 'bike', 'bus', 'car', 'taxi', 'subway', 'train']
+PLT_HEADER = "Geolife trajectory\nWGS 84\nAltitude is in Feet\nReserved 3\n0,2,255,My Track,0,0,2,8421376\n0\n"
+# Day 0 of the fractional date column in .plt files
+PLT_EPOCH = datetime.datetime(1899, 12, 30)
+ORIGIN = (39.9042, 116.4074)
+
+
+def write_plt(path, start, point_count, rng):
+    # Returns the time of the last point
+    lat = ORIGIN[0] + rng.uniform(-0.2, 0.2)
+    lon = ORIGIN[1] + rng.uniform(-0.2, 0.2)
+    altitude = rng.randint(50, 300)
+    timestamp = last = start
+    with open(path, 'w') as f:
+        f.write(PLT_HEADER)
+        for _ in range(point_count):
+            # GeoLife marks a missing altitude with -777
+            point_altitude = -777 if rng.random() < 0.02 else altitude
+            date_days = (timestamp - PLT_EPOCH).total_seconds() / 86400
+            f.write(f"{lat:.6f},{lon:.6f},0,{point_altitude},{date_days:.10f},"
+                    f"{timestamp:%Y-%m-%d},{timestamp:%H:%M:%S}\n")
+            last = timestamp
+            lat += rng.gauss(0, 0.0002)
+            lon += rng.gauss(0, 0.0002)
+            altitude = max(0, altitude + rng.randint(-5, 5))
+            timestamp += datetime.timedelta(seconds=rng.choice((1, 2, 5, 5, 5, 10)))
+    return last
+
+
+def generate(output_path, users=10, activities_per_user=20, points_per_activity=500,
+             labeled_fraction=0.3, label_density=0.5, seed=0):
+    """
+    Writes the dataset and returns (users, activities, trackpoints, labels) written.
+    points_per_activity is a mean; activities vary from half to one and a half times
+    it, so some may exceed the 2500 line limit of main.py and be skipped there.
+    labeled_fraction of the users get a labels.txt, in which label_density of their
+    activities have a label with exactly the activity's start and end time.
+    """
+    rng = random.Random(seed)
+    data_path = os.path.join(output_path, 'dataset', 'Data')
+    labeled_ids = []
+    totals = [0, 0, 0, 0]
+
+    for user_index in range(users):
+        user_id = f"{user_index:03d}"
+        trajectory_path = os.path.join(data_path, user_id, 'Trajectory')
+        os.makedirs(trajectory_path, exist_ok=True)
+        labeled = rng.random() < labeled_fraction
+        labels = []
+
+        start = datetime.datetime(2008, 1, 1) + datetime.timedelta(days=rng.randint(0, 1000))
+        for _ in range(activities_per_user):
+            point_count = max(1, int(points_per_activity * rng.uniform(0.5, 1.5)))
+            path = os.path.join(trajectory_path, f"{start:%Y%m%d%H%M%S}.plt")
+            end = write_plt(path, start, point_count, rng)
+            if labeled and rng.random() < label_density:
+                labels.append((start, end, rng.choice(TRANSPORTATION_MODES)))
+            totals[1] += 1
+            totals[2] += point_count
+            start = end + datetime.timedelta(hours=rng.randint(1, 48))
+
+        if labeled:
+            labeled_ids.append(user_id)
+            with open(os.path.join(data_path, user_id, 'labels.txt'), 'w') as f:
+                f.write("Start Time\tEnd Time\tTransportation Mode\n")
+                for label_start, label_end, mode in labels:
+                    f.write(f"{label_start:%Y/%m/%d %H:%M:%S}\t{label_end:%Y/%m/%d %H:%M:%S}\t{mode}\n")
+            totals[3] += len(labels)
+        totals[0] += 1
+
+    with open(os.path.join(output_path, 'dataset', 'labeled_ids.txt'), 'w') as f:
+        f.write(''.join(f"{user_id}\n" for user_id in labeled_ids))
+    return tuple(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic GeoLife-shaped dataset.")
+    parser.add_argument('output_path', help="Directory to write to; main.py reads <output_path>/dataset/...")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--activities-per-user', type=int, default=20)
+    parser.add_argument('--points-per-activity', type=int, default=500)
+    parser.add_argument('--labeled-fraction', type=float, default=0.3,
+                        help="Fraction of users with a labels.txt (default: 0.3)")
+    parser.add_argument('--label-density', type=float, default=0.5,
+                        help="Fraction of a labeled user's activities that have a label (default: 0.5)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    users, activities, trackpoints, labels = generate(
+        args.output_path, args.users, args.activities_per_user, args.points_per_activity,
+        args.labeled_fraction, args.label_density, args.seed)
+    print(f"Wrote {users} users, {activities} activities, {trackpoints} trackpoints "
+          f"and {labels} labels to {args.output_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import datetime
+import functools
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for parse_plt_datetime64
+    np = None
+
+# Decoders for the fixed timestamp formats used by GeoLife. The .plt files store
+# "YYYY-MM-DD" and "HH:MM:SS" in separate columns and labels.txt stores
+# "YYYY/MM/DD HH:MM:SS". Slicing fixed offsets is several times faster than
+# datetime.strptime, which re-interprets its format string on every call.
+
+# Day 0 of the date_days column in the .plt files
+DATE_DAYS_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_date(date, separator):
+    # A trajectory only spans a few dates, so the date half is cached
+    if len(date) != 10 or date[4] != separator or date[7] != separator:
+        raise ValueError(f"date data {date!r} does not match format 'YYYY{separator}MM{separator}DD'")
+    return int(date[0:4]), int(date[5:7]), int(date[8:10])
+
+
+def _parse_time(time):
+    if len(time) != 8 or time[2] != ':' or time[5] != ':':
+        raise ValueError(f"time data {time!r} does not match format 'HH:MM:SS'")
+    return int(time[0:2]), int(time[3:5]), int(time[6:8])
+
+
+def parse_plt_datetime(date, time):
+    # Equivalent to strptime(f"{date} {time}", "%Y-%m-%d %H:%M:%S"); raises ValueError on bad input
+    year, month, day = _parse_date(date, '-')
+    hour, minute, second = _parse_time(time)
+    return datetime.datetime(year, month, day, hour, minute, second)
+
+
+def parse_label_datetime(value):
+    # Equivalent to strptime(value, "%Y/%m/%d %H:%M:%S"); raises ValueError on bad input
+    if len(value) != 19 or value[10] != ' ':
+        raise ValueError(f"time data {value!r} does not match format 'YYYY/MM/DD HH:MM:SS'")
+    year, month, day = _parse_date(value[:10], '/')
+    hour, minute, second = _parse_time(value[11:])
+    return datetime.datetime(year, month, day, hour, minute, second)
+
+
+def year_range(year):
+    # [start, end) of a calendar year. Filtering on column >= start AND column < end
+    # instead of YEAR(column) = year can use indexes and partition pruning.
+    return datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)
+
+
+def parse_plt_datetimes(dates, times):
+    # Batched variant for a whole file's date and time columns
+    return [parse_plt_datetime(date, time) for date, time in zip(dates, times)]
+
+
+def parse_plt_datetime64(dates, times):
+    # Decodes the columns into a numpy datetime64[s] array in one call
+    if np is None:
+        raise ImportError("parse_plt_datetime64 requires numpy")
+    return np.array([f"{date}T{time}" for date, time in zip(dates, times)], dtype='datetime64[s]')
+
+
+def datetimes_from_date_days(date_days):
+    # Derives the timestamps from the fractional date_days column instead of the
+    # text columns, rounded to whole seconds like the text representation
+    return [DATE_DAYS_EPOCH + datetime.timedelta(seconds=round(days * 86400)) for days in date_days]
+
+
+def benchmark(rows=100000, repeat=3):
+    import timeit
+
+    start = datetime.datetime(2008, 10, 23, 2, 53, 4)
+    instants = [start + datetime.timedelta(seconds=5 * i) for i in range(rows)]
+    dates = [t.strftime('%Y-%m-%d') for t in instants]
+    times = [t.strftime('%H:%M:%S') for t in instants]
+    date_days = [(t - DATE_DAYS_EPOCH).total_seconds() / 86400 for t in instants]
+    labels = [t.strftime('%Y/%m/%d %H:%M:%S') for t in instants]
+
+    cases = [
+        ('strptime (per line)', lambda: [datetime.datetime.strptime(f"{d} {t}", "%Y-%m-%d %H:%M:%S")
+                                         for d, t in zip(dates, times)]),
+        ('parse_plt_datetime (per line)', lambda: [parse_plt_datetime(d, t) for d, t in zip(dates, times)]),
+        ('parse_plt_datetimes (batch)', lambda: parse_plt_datetimes(dates, times)),
+        ('datetimes_from_date_days (batch)', lambda: datetimes_from_date_days(date_days)),
+    ]
+    if np is not None:
+        cases.append(('parse_plt_datetime64 (batch)', lambda: parse_plt_datetime64(dates, times)))
+    cases += [
+        ('strptime (labels)', lambda: [datetime.datetime.strptime(v, "%Y/%m/%d %H:%M:%S") for v in labels]),
+        ('parse_label_datetime (labels)', lambda: [parse_label_datetime(v) for v in labels]),
+    ]
+
+    assert parse_plt_datetimes(dates, times) == instants
+    assert datetimes_from_date_days(date_days) == instants
+
+    baseline = None
+    print(f"Parsing {rows} timestamps, best of {repeat} (speedup relative to the strptime case above it):")
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        if name.startswith('strptime'):
+            baseline = seconds
+        print(f"  {name:<35} {seconds:8.3f} s  {baseline / seconds:5.1f}x")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,205 @@
+import argparse
+import time
+from backends import BACKENDS, dialect_of
+from indexes import create_indexes, table_columns
+from loaders import TRACKPOINT_COLUMNS
+from partitions import is_partitioned, partition_clause
+from tabulate import tabulate
+
+# Two layouts for the TrackPoint table:
+#
+# standard: surrogate INT AUTO_INCREMENT id, DOUBLE lat/lon, INT altitude and both
+#   date_days and date_time. Trackpoints of one activity are spread over the
+#   clustered id order and found through idx_trackpoint_activity_id.
+# compact: clustered PRIMARY KEY (activity_id, seq), where seq is the position in
+#   the .plt file. lat/lon are DECIMAL(9,6) (the precision of the files, 5 instead
+#   of 8 bytes), altitude is MEDIUMINT and date_days is dropped, since date_time is
+#   the same instant. A scan of one activity reads consecutive rows of one index.
+#   Optionally ROW_FORMAT=COMPRESSED on MySQL; WITHOUT ROWID on SQLite.
+#
+# Code that needs the trackpoints of an activity in recorded order sorts by
+# order_column(): id in the standard layout, seq in the compact one.
+
+LAYOUTS = ['standard', 'compact']
+
+LOAD_COLUMNS = {
+    'standard': TRACKPOINT_COLUMNS,
+    'compact': ('activity_id', 'seq', 'lat', 'lon', 'altitude', 'date_time'),
+}
+
+# InnoDB compressed pages of 8 KB, half the default page size
+COMPRESSED_ROW_FORMAT = "ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8"
+
+
+def trackpoint_table_sql(dialect, layout='standard', compress=False, table='TrackPoint', partitioned=False):
+    # Spatial column for spatial.py. SQLite has no geometry types and MySQL allows none in
+    # partitioned tables; spatial.py searches lat/lon there instead.
+    location_column = ("location POINT SRID 0 GENERATED ALWAYS AS (POINT(lon, lat)) STORED NOT NULL,"
+                       if dialect == 'mysql' and not partitioned else "")
+    # Partitioned by month of date_time, which must then be part of the primary key
+    # and rules out the foreign key, see partitions.py
+    if partitioned:
+        date_time_type, key_suffix, partitioning = "DATETIME NOT NULL", ", date_time", partition_clause('date_time')
+        foreign_key = ""
+    else:
+        date_time_type, key_suffix, partitioning = "DATETIME", "", ""
+        foreign_key = ", FOREIGN KEY (activity_id) REFERENCES Activity(id)"
+    if layout == 'standard':
+        # SQLite only auto-increments an inline INTEGER PRIMARY KEY, so that form is kept when possible
+        id_key = "" if partitioned else " PRIMARY KEY"
+        constraint = "PRIMARY KEY (id, date_time)" if partitioned else foreign_key.lstrip(', ')
+        return f"""CREATE TABLE IF NOT EXISTS {table} (
+                   id INT AUTO_INCREMENT NOT NULL{id_key},
+                   activity_id BIGINT,
+                   lat DOUBLE,
+                   lon DOUBLE,
+                   altitude INT,
+                   date_days DOUBLE,
+                   date_time {date_time_type},
+                   {location_column}
+                   {constraint}) {partitioning}
+                """
+    if dialect == 'mysql':
+        options = COMPRESSED_ROW_FORMAT if compress else ""
+    else:
+        # Makes the primary key the table's b-tree, like the InnoDB clustered index
+        options = "WITHOUT ROWID"
+    return f"""CREATE TABLE IF NOT EXISTS {table} (
+               activity_id BIGINT NOT NULL,
+               seq SMALLINT UNSIGNED NOT NULL,
+               lat DECIMAL(9,6),
+               lon DECIMAL(9,6),
+               altitude MEDIUMINT,
+               date_time {date_time_type},
+               {location_column}
+               PRIMARY KEY (activity_id, seq{key_suffix}){foreign_key}) {options} {partitioning}
+            """
+
+
+def trackpoint_layout(cursor):
+    # Layout of the existing TrackPoint table
+    return 'compact' if 'seq' in table_columns(cursor, 'TrackPoint') else 'standard'
+
+
+def order_column(cursor):
+    # Column that orders the trackpoints of an activity as recorded
+    return 'seq' if trackpoint_layout(cursor) == 'compact' else 'id'
+
+
+def to_load_rows(trackpoints, layout):
+    # Parsed (activity_id, lat, lon, altitude, date_days, date_time) tuples of one
+    # file, in file order, as rows for LOAD_COLUMNS[layout]
+    if layout == 'standard':
+        return trackpoints
+    return [(activity_id, seq, lat, lon, altitude, date_time)
+            for seq, (activity_id, lat, lon, altitude, _, date_time) in enumerate(trackpoints)]
+
+
+def table_size(db_connection, cursor, table='TrackPoint'):
+    # (rows, bytes of data and indexes)
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    rows = cursor.fetchone()[0]
+    if dialect_of(cursor) == 'sqlite':
+        # Counts the pages of the table and of its indexes
+        cursor.execute("""SELECT COALESCE(SUM(d.pgsize), 0)
+                          FROM dbstat d JOIN sqlite_master m ON m.name = d.name
+                          WHERE m.tbl_name = %s""", (table,))
+        return rows, cursor.fetchone()[0]
+    # The sizes in information_schema are only refreshed by ANALYZE TABLE
+    cursor.execute(f"ANALYZE TABLE {table}")
+    cursor.fetchall()
+    db_connection.commit()
+    cursor.execute("""SELECT data_length + index_length FROM information_schema.tables
+                      WHERE table_schema = DATABASE() AND table_name = %s""", (table,))
+    return rows, cursor.fetchone()[0]
+
+
+def scan_seconds(program):
+    # Time of a full per-activity scan in recorded order, as query 7 does it
+    from distance_engine import DistanceEngine
+
+    start = time.perf_counter()
+    DistanceEngine(program).per_activity()
+    return time.perf_counter() - start
+
+
+def measure(program):
+    rows, size = table_size(program.db_connection, program.cursor)
+    return {'layout': trackpoint_layout(program.cursor), 'rows': rows, 'bytes': size,
+            'scan_seconds': scan_seconds(program)}
+
+
+def migrate(program, compress=False, activities_per_batch=1000):
+    # Rewrites a standard TrackPoint table into the compact layout. seq is numbered
+    # from the id order within each activity. Copies in batches of activities, each
+    # committed, then swaps the tables.
+    db_connection, cursor = program.db_connection, program.cursor
+    dialect = dialect_of(cursor)
+    if trackpoint_layout(cursor) == 'compact':
+        print("TrackPoint already has the compact layout.")
+        return False
+
+    cursor.execute("DROP TABLE IF EXISTS TrackPoint_compact")
+    cursor.execute(trackpoint_table_sql(dialect, 'compact', compress, table='TrackPoint_compact',
+                                        partitioned=is_partitioned(cursor, 'TrackPoint')))
+    db_connection.commit()
+
+    cursor.execute("SELECT id FROM Activity ORDER BY id")
+    activity_ids = [row[0] for row in cursor.fetchall()]
+    for i in range(0, len(activity_ids), activities_per_batch):
+        batch = activity_ids[i:i + activities_per_batch]
+        try:
+            cursor.execute("""INSERT INTO TrackPoint_compact (activity_id, seq, lat, lon, altitude, date_time)
+                              SELECT activity_id, ROW_NUMBER() OVER (PARTITION BY activity_id ORDER BY id) - 1,
+                                     lat, lon, altitude, date_time
+                              FROM TrackPoint
+                              WHERE activity_id BETWEEN %s AND %s""", (batch[0], batch[-1]))
+            db_connection.commit()
+        except Exception:
+            db_connection.rollback()
+            raise
+        print(f"Copied trackpoints of {i + len(batch)}/{len(activity_ids)} activities...")
+
+    if dialect == 'mysql':
+        # Swapped in one atomic statement
+        cursor.execute("RENAME TABLE TrackPoint TO TrackPoint_standard, TrackPoint_compact TO TrackPoint")
+    else:
+        cursor.execute("ALTER TABLE TrackPoint RENAME TO TrackPoint_standard")
+        cursor.execute("ALTER TABLE TrackPoint_compact RENAME TO TrackPoint")
+    cursor.execute("DROP TABLE TrackPoint_standard")
+    db_connection.commit()
+    # The spatial index lived on the old table
+    create_indexes(db_connection, cursor)
+    return True
+
+
+def main():
+    from part2 import ActivityTrackerProgram
+
+    parser = argparse.ArgumentParser(description="Report on or migrate the TrackPoint table layout.")
+    parser.add_argument('command', choices=['report', 'migrate'],
+                        help="report: size and scan time of TrackPoint; migrate: convert it to the compact layout "
+                             "and report before and after")
+    parser.add_argument('--compress', action='store_true', help="Use InnoDB compressed pages (MySQL only)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql')
+    args = parser.parse_args()
+
+    program = None
+    try:
+        program = ActivityTrackerProgram(cache=None, backend=args.backend)
+        phases = [('before' if args.command == 'migrate' else 'current', measure(program))]
+        if args.command == 'migrate' and migrate(program, args.compress):
+            phases.append(('after', measure(program)))
+        rows = [(label, m['layout'], m['rows'], round(m['bytes'] / 1024 / 1024, 2),
+                 round(m['bytes'] / m['rows'], 1) if m['rows'] else None, round(m['scan_seconds'], 3))
+                for label, m in phases]
+        print(tabulate(rows, headers=['', 'Layout', 'Rows', 'Size (MiB)', 'Bytes/row', 'Scan (s)'],
+                       tablefmt='psql'))
+    except Exception as e:
+        print("An error occurred:", e)
+    finally:
+        if program:
+            program.connection.close_connection()
+
+if __name__ == '__main__':
+    main()